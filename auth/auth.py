@@ -1,15 +1,33 @@
-import json
 import os
+import time
 
 from functools import wraps
-from urllib.request import urlopen
 from flask import request, abort
 from jose import jwt
 
+from .jwks import FileJWKSStore, JWKSStore
+from .metrics import timed
+from .permissions import PermissionRegistry, TokenPayload
+from .throttle import FailureLimiter
+from .token_cache import TokenCache
+
 AUTH0_DOMAIN = os.getenv('AUTH0_DOMAIN')
 ALGORITHMS = os.getenv('ALGORITHMS')
 API_AUDIENCE = os.getenv('API_AUDIENCE')
 JWKS_URL = os.getenv('JWKS_URL')
+JWKS_PATH = os.getenv('JWKS_PATH')
+ISSUER = f'https://{AUTH0_DOMAIN}/'
+REJECTED_TOKEN_TTL = int(os.getenv('REJECTED_TOKEN_TTL', 60))
+
+# JWKS_PATH switches to offline mode, see auth/local_issuer.py
+if JWKS_PATH:
+    jwks_store = FileJWKSStore(JWKS_PATH)
+else:
+    jwks_store = JWKSStore(JWKS_URL)
+token_cache = TokenCache()
+rejected_tokens = TokenCache()
+failure_limiter = FailureLimiter()
+permission_registry = PermissionRegistry()
 
 
 class AuthError(Exception):
@@ -58,43 +76,88 @@ def get_token_auth_header():
     return token
 
 
-def check_permissions(permission, payload):
+def as_permissions(permission):
+    """requires_auth takes a single permission or a list of permissions that
+    are all required"""
+    if isinstance(permission, str):
+        return (permission,)
+    return tuple(permission)
+
+
+def check_permission_mask(required, payload):
     if 'permissions' not in payload:
         abort(400)
-    if permission not in payload['permissions']:
+    granted = permission_registry.payload_mask(payload)
+    if granted & required != required:
         abort(403)
     return True
 
 
+def check_permissions(permission, payload):
+    required = permission_registry.register(*as_permissions(permission))
+    return check_permission_mask(required, payload)
+
+
 def verify_decode_jwt(token):
-    jsonurl = urlopen(JWKS_URL)
-    jwks = json.loads(jsonurl.read())
+    # repeat callers skip the signature check until their token expires, and
+    # known bad tokens are turned away without any crypto or network work
+    with timed('cache'):
+        payload = token_cache.get(token)
+        rejection = rejected_tokens.get(token) if payload is None else None
+    if payload is not None:
+        return payload
+    # a changed key set may make a rejected token valid, e.g. after rotation
+    generation = jwks_store.generation
+    if rejection is not None and rejection[2] == generation:
+        raise AuthError(rejection[0], rejection[1])
+
+    try:
+        return decode_jwt(token)
+    except AuthError as error:
+        remember_rejection(token, error.error, error.status_code, generation)
+        raise
+    except Exception:
+        remember_rejection(token, {
+            'code': 'invalid_header',
+            'description': 'Unable to parse authentication token.'
+        }, 401, generation)
+        raise
+
+
+def remember_rejection(token, error, status_code, generation):
+    rejected_tokens.set(token, (error, status_code, generation),
+                        time.time() + REJECTED_TOKEN_TTL)
+
+
+def decode_jwt(token):
     unverified_header = jwt.get_unverified_header(token)
-    rsa_key = {}
     if 'kid' not in unverified_header:
         raise AuthError({
             'code': 'invalid_header',
             'description': 'Authorization malformed.'
         }, 401)
 
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
-    if rsa_key:
+    with timed('key'):
+        key = jwks_store.get_key(unverified_header['kid'])
+    if key:
         try:
-            payload = jwt.decode(
-                token,
-                rsa_key,
-                algorithms=ALGORITHMS,
-                audience=API_AUDIENCE,
-                issuer=f'https://{AUTH0_DOMAIN}/'
-            )
+            with timed('verify'):
+                # the key is bound to one algorithm, never trust the header's
+                if unverified_header.get('alg') != key.alg or \
+                        (ALGORITHMS and key.alg not in ALGORITHMS) or \
+                        not key.verify(token):
+                    raise jwt.JWTError('Signature verification failed.')
+
+                payload = jwt.decode(
+                    token,
+                    key.verifier,
+                    algorithms=ALGORITHMS,
+                    audience=API_AUDIENCE,
+                    issuer=ISSUER,
+                    options={'verify_signature': False}
+                )
+            payload = TokenPayload(payload, permission_registry)
+            token_cache.set(token, payload)
 
             return payload
 
@@ -122,16 +185,28 @@ def verify_decode_jwt(token):
 
 
 def requires_auth(permission=''):
+    # compiled once per route, when the blueprint is imported
+    required = permission_registry.register(*as_permissions(permission))
+
     def requires_auth_decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
-            token = get_token_auth_header()
+            with timed('header'):
+                token = get_token_auth_header()
+
+            # sources that keep failing only get in with a known good token
+            source = request.remote_addr
+            if failure_limiter.is_throttled(source) and \
+                    token not in token_cache:
+                abort(429)
+
             try:
                 payload = verify_decode_jwt(token)
             except:  # noqa
+                failure_limiter.record(source)
                 abort(401)
 
-            check_permissions(permission, payload)
+            check_permission_mask(required, payload)
 
             return f(payload, *args, **kwargs)
         return wrapper
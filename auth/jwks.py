@@ -0,0 +1,193 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from urllib.request import urlopen
+from jose import jwk
+from jose.exceptions import JWKError
+from jose.utils import base64url_decode
+
+JWKS_TTL = int(os.getenv('JWKS_TTL', 600))
+JWKS_MIN_REFRESH_INTERVAL = int(os.getenv('JWKS_MIN_REFRESH_INTERVAL', 30))
+JWKS_FETCH_TIMEOUT = float(os.getenv('JWKS_FETCH_TIMEOUT', 5))
+
+logger = logging.getLogger(__name__)
+
+
+class PublicKey(object):
+    """A JWK parsed once into a ready to use signature verifier
+
+    jose.jwt.decode rebuilds the key object from the modulus and exponent on
+    every call, so the store keeps these instead of the raw JWK dicts.
+    """
+    def __init__(self, key):
+        self.kid = key['kid']
+        self.alg = key.get('alg', 'RS256')
+        self.verifier = jwk.construct(key, self.alg)
+
+    def verify(self, token):
+        """Checks the signature of a compact JWS token, returns a bool"""
+        signing_input, _, signature = token.rpartition('.')
+        try:
+            return self.verifier.verify(
+                signing_input.encode('utf-8'),
+                base64url_decode(signature.encode('utf-8')))
+        except Exception:
+            return False
+
+
+def parse_jwks(jwks):
+    """Builds the kid -> PublicKey registry, skipping keys we can't use"""
+    keys = {}
+    for key in jwks['keys']:
+        if key.get('use', 'sig') != 'sig':
+            continue
+        try:
+            keys[key['kid']] = PublicKey(key)
+        except (JWKError, KeyError, ValueError, TypeError):
+            continue
+    return keys
+
+
+class JWKSStore(object):
+    """In-process cache of the identity provider's JSON Web Key Set
+
+    Keys are indexed by kid and shared by every thread in the worker. Once
+    the ttl lapses, or when a token names a kid we haven't seen (key
+    rotation), the current keys keep being served while a single background
+    thread refetches the document. Refetches are attempted at most once per
+    min_refresh_interval, so tokens with made up kids can't be used to hammer
+    the identity provider, and every fetch is bounded by timeout.
+
+    Only a cold store blocks the caller. start_refresher keeps the store
+    warm from a daemon thread so request threads never wait on the network.
+    """
+    def __init__(self, url, ttl=JWKS_TTL,
+                 min_refresh_interval=JWKS_MIN_REFRESH_INTERVAL,
+                 timeout=JWKS_FETCH_TIMEOUT):
+        self.url = url
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self.timeout = timeout
+        self.keys = {}
+        # bumped whenever the set of kids changes
+        self.generation = 0
+        self.fetched_at = None
+        self.attempted_at = None
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._fetch_lock = threading.Lock()
+        self._refresh_thread = None
+        self._refresher = None
+        self._stopped = threading.Event()
+
+    def fetch(self):
+        jsonurl = urlopen(self.url, timeout=self.timeout)
+        return json.loads(jsonurl.read())
+
+    def refresh(self):
+        with self._fetch_lock:
+            self._refresh()
+
+    def _refresh(self):
+        self.attempted_at = time.monotonic()
+        jwks = self.fetch()
+        keys = parse_jwks(jwks)
+        if keys.keys() != self.keys.keys():
+            self.generation += 1
+        # swap in a whole new dict so readers never see a partial key set
+        self.keys = keys
+        self.fetched_at = time.monotonic()
+
+    def try_refresh(self):
+        """Refreshes the keys, keeping the current ones if the fetch fails.
+        Returns whether the refresh succeeded."""
+        try:
+            self.refresh()
+            self.last_error = None
+            return True
+        except Exception as error:
+            self.last_error = error
+            logger.warning('Unable to refresh JWKS from %s: %s', self.url,
+                           error)
+            return False
+
+    def refresh_async(self):
+        """Starts a background refresh unless one is already in flight"""
+        with self._lock:
+            if self._refresh_thread is not None and \
+                    self._refresh_thread.is_alive():
+                return
+            self.attempted_at = time.monotonic()
+            self._refresh_thread = threading.Thread(
+                target=self.try_refresh, name='jwks-refresh', daemon=True)
+            self._refresh_thread.start()
+
+    def wait_for_refresh(self, timeout=None):
+        thread = self._refresh_thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def is_expired(self, now):
+        return self.fetched_at is None or now - self.fetched_at >= self.ttl
+
+    def can_refetch(self, now):
+        return self.attempted_at is None or \
+            now - self.attempted_at >= self.min_refresh_interval
+
+    def get_key(self, kid):
+        """Returns the PublicKey for kid, or None if the provider has no such
+        key. Stale keys are served while a refresh runs in the background."""
+        if self.fetched_at is None:
+            with self._fetch_lock:
+                # another thread may have warmed the store, or just failed
+                # to, while we waited
+                if self.fetched_at is None and \
+                        self.can_refetch(time.monotonic()):
+                    self._refresh()
+
+        now = time.monotonic()
+        key = self.keys.get(kid)
+        if (self.is_expired(now) or key is None) and self.can_refetch(now):
+            self.refresh_async()
+
+        return key
+
+    def start_refresher(self, interval=None):
+        """Refreshes the keys every interval seconds (half the ttl by
+        default) from a daemon thread, retrying failures sooner."""
+        with self._lock:
+            if self._refresher is not None and self._refresher.is_alive():
+                return
+            self._stopped.clear()
+            self._refresher = threading.Thread(
+                target=self._run_refresher, args=(interval or self.ttl / 2,),
+                name='jwks-refresher', daemon=True)
+            self._refresher.start()
+
+    def stop_refresher(self):
+        self._stopped.set()
+        if self._refresher is not None:
+            self._refresher.join()
+
+    def _run_refresher(self, interval):
+        while not self._stopped.is_set():
+            if self.try_refresh():
+                wait = interval
+            else:
+                wait = min(interval, self.min_refresh_interval)
+            self._stopped.wait(wait)
+
+
+class FileJWKSStore(JWKSStore):
+    """Reads the key set from a local jwks.json instead of the identity
+    provider, for running offline against keys from auth.local_issuer"""
+    def __init__(self, path, **kwargs):
+        super().__init__(None, **kwargs)
+        self.path = path
+
+    def fetch(self):
+        with open(self.path) as jwks_file:
+            return json.load(jwks_file)
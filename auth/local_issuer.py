@@ -0,0 +1,109 @@
+"""Local stand-in for Auth0, for running the API without network access
+
+generate_signing_key writes an RSA private key plus the matching public
+jwks.json. Point JWKS_PATH at that file and auth validates tokens against it
+instead of fetching JWKS_URL, and mint_token signs tokens that carry whatever
+permissions a test or load test needs.
+
+    flask auth keygen ./local-issuer
+    export JWKS_PATH=./local-issuer/jwks.json
+    flask auth token --key ./local-issuer/signing_key.pem --role agent
+"""
+import json
+import os
+import time
+
+import click
+from Crypto.PublicKey import RSA
+from flask.cli import AppGroup
+from jose import jwk, jwt
+
+LOCAL_KID = 'local-signing-key'
+
+ROLE_PERMISSIONS = {
+    'agent_assistant': [
+        'get:player-details', 'get:teams', 'get:team-roster', 'get:agents'
+    ],
+    'agent': [
+        'get:player-details', 'get:teams', 'get:team-roster', 'get:agents',
+        'get:team-details', 'post:players', 'post:teams', 'patch:players',
+        'patch:teams', 'delete:players', 'delete:teams'
+    ],
+    'executive_agent': [
+        'get:player-details', 'get:teams', 'get:team-roster', 'get:agents',
+        'get:team-details', 'get:agent-details', 'get:agent-clients',
+        'post:agents', 'patch:agents', 'delete:agents'
+    ]
+}
+
+
+def generate_signing_key(directory, kid=LOCAL_KID, bits=2048):
+    """Writes signing_key.pem and jwks.json to directory and returns both
+    paths"""
+    private_pem = RSA.generate(bits).export_key().decode('utf-8')
+    public_jwk = jwk.construct(private_pem, 'RS256').public_key().to_dict()
+    public_jwk.update({'kid': kid, 'use': 'sig', 'alg': 'RS256'})
+
+    os.makedirs(directory, exist_ok=True)
+    private_key_path = os.path.join(directory, 'signing_key.pem')
+    jwks_path = os.path.join(directory, 'jwks.json')
+
+    with open(private_key_path, 'w') as private_key_file:
+        private_key_file.write(private_pem)
+    with open(jwks_path, 'w') as jwks_file:
+        json.dump({'keys': [public_jwk]}, jwks_file)
+
+    return private_key_path, jwks_path
+
+
+def mint_token(private_key_path, permissions, audience=None, issuer=None,
+               kid=LOCAL_KID, expires_in=3600, subject='local|tester'):
+    """Signs an Auth0 style access token carrying permissions"""
+    with open(private_key_path) as private_key_file:
+        private_pem = private_key_file.read()
+
+    now = int(time.time())
+    claims = {
+        'sub': subject,
+        'iat': now,
+        'exp': now + expires_in,
+        'permissions': list(permissions)
+    }
+    if audience is not None:
+        claims['aud'] = audience
+    if issuer is not None:
+        claims['iss'] = issuer
+
+    return jwt.encode(claims, private_pem, algorithm='RS256',
+                      headers={'kid': kid})
+
+
+auth_cli = AppGroup('auth', help='Local signing keys and tokens.')
+
+
+@auth_cli.command('keygen')
+@click.argument('directory')
+@click.option('--kid', default=LOCAL_KID, show_default=True)
+def keygen_command(directory, kid):
+    """Generates a local signing key and its jwks.json."""
+    private_key_path, jwks_path = generate_signing_key(directory, kid=kid)
+    click.echo(f'signing key: {private_key_path}')
+    click.echo(f'export JWKS_PATH={os.path.abspath(jwks_path)}')
+
+
+@auth_cli.command('token')
+@click.option('--key', 'private_key_path', required=True,
+              help='signing_key.pem written by keygen.')
+@click.option('--role', type=click.Choice(sorted(ROLE_PERMISSIONS)))
+@click.option('--permission', 'permissions', multiple=True,
+              help='Extra permission, may be repeated.')
+@click.option('--expires-in', default=3600, show_default=True)
+@click.option('--kid', default=LOCAL_KID, show_default=True)
+def token_command(private_key_path, role, permissions, expires_in, kid):
+    """Mints a token the API accepts when JWKS_PATH is set."""
+    from auth.auth import API_AUDIENCE, ISSUER
+
+    permissions = ROLE_PERMISSIONS.get(role, []) + list(permissions)
+    click.echo(mint_token(private_key_path, permissions,
+                          audience=API_AUDIENCE, issuer=ISSUER, kid=kid,
+                          expires_in=expires_in))
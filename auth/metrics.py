@@ -0,0 +1,105 @@
+import threading
+import time
+
+from contextlib import contextmanager
+from flask import g, has_request_context
+
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+
+class Histogram(object):
+    """Fixed bucket histogram with one label, rendered in the Prometheus
+    text exposition format. Counts are per process, so each gunicorn worker
+    reports its own."""
+    def __init__(self, name, description, label, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label = label
+        self.buckets = buckets
+        self.series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value, value):
+        with self._lock:
+            series = self.series.get(label_value)
+            if series is None:
+                series = self.series[label_value] = {
+                    'buckets': [0] * len(self.buckets),
+                    'sum': 0.0,
+                    'count': 0
+                }
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['buckets'][index] += 1
+                    break
+            series['sum'] += value
+            series['count'] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}',
+                 f'# TYPE {self.name} histogram']
+        with self._lock:
+            for label_value, series in sorted(self.series.items()):
+                label = f'{self.label}="{label_value}"'
+                cumulative = 0
+                for bound, count in zip(self.buckets, series['buckets']):
+                    cumulative += count
+                    lines.append(f'{self.name}_bucket{{{label},le="{bound}"}}'
+                                 f' {cumulative}')
+                lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} '
+                             f'{series["count"]}')
+                lines.append(f'{self.name}_sum{{{label}}} {series["sum"]}')
+                lines.append(f'{self.name}_count{{{label}}} '
+                             f'{series["count"]}')
+        return lines
+
+
+auth_phase_seconds = Histogram(
+    'auth_phase_seconds',
+    'Time spent in each phase of requires_auth.',
+    'phase')
+
+
+@contextmanager
+def timed(phase):
+    """Times an auth phase into the histogram, and into the current
+    request's Server-Timing header"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        auth_phase_seconds.observe(phase, elapsed)
+        if has_request_context():
+            g.setdefault('auth_timings', []).append((phase, elapsed))
+
+
+def add_server_timing(response):
+    timings = g.get('auth_timings')
+    if timings:
+        entries = [f'auth-{phase};dur={elapsed * 1000:.3f}'
+                   for phase, elapsed in timings]
+        existing = response.headers.get('Server-Timing')
+        if existing:
+            entries.insert(0, existing)
+        response.headers['Server-Timing'] = ', '.join(entries)
+    return response
+
+
+def render_counter(name, description, value):
+    return [f'# HELP {name} {description}',
+            f'# TYPE {name} counter',
+            f'{name} {value}']
+
+
+def render_metrics():
+    from .auth import token_cache
+
+    stats = token_cache.stats()
+    lines = auth_phase_seconds.render()
+    lines += render_counter('auth_token_cache_hits_total',
+                            'Verified token cache hits.', stats['hits'])
+    lines += render_counter('auth_token_cache_misses_total',
+                            'Verified token cache misses.', stats['misses'])
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,52 @@
+import threading
+
+
+class PermissionRegistry(object):
+    """Compiles permission strings to bits so a check is a single AND
+
+    requires_auth registers the permissions of every route it decorates, so
+    the vocabulary is complete once create_app has imported the blueprints.
+    Permissions a token carries that no route checks don't get a bit and are
+    ignored.
+    """
+    def __init__(self):
+        self.bits = {}
+        self._lock = threading.Lock()
+
+    def register(self, *permissions):
+        """Returns the mask for permissions, assigning bits to new ones"""
+        mask = 0
+        with self._lock:
+            for permission in permissions:
+                if permission not in self.bits:
+                    self.bits[permission] = 1 << len(self.bits)
+                mask |= self.bits[permission]
+        return mask
+
+    def mask(self, permissions):
+        bits = self.bits
+        mask = 0
+        for permission in permissions:
+            mask |= bits.get(permission, 0)
+        return mask
+
+    def payload_mask(self, payload):
+        """Mask of the permissions a decoded token carries. TokenPayloads
+        compute it once and keep it, unless new permissions were registered
+        since."""
+        if not isinstance(payload, TokenPayload):
+            return self.mask(payload['permissions'])
+
+        if payload.registry_size != len(self.bits):
+            payload.registry_size = len(self.bits)
+            payload.permission_mask = self.mask(payload['permissions'])
+        return payload.permission_mask
+
+
+class TokenPayload(dict):
+    """Decoded token claims, plus the permissions compiled to a bitmask. It
+    is what the token cache holds, so the mask is built once per token."""
+    def __init__(self, claims, registry):
+        super().__init__(claims)
+        self.registry_size = len(registry.bits)
+        self.permission_mask = registry.mask(claims.get('permissions', ()))
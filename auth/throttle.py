@@ -0,0 +1,51 @@
+import os
+import threading
+import time
+
+from collections import OrderedDict
+
+AUTH_FAILURE_LIMIT = int(os.getenv('AUTH_FAILURE_LIMIT', 20))
+AUTH_FAILURE_WINDOW = int(os.getenv('AUTH_FAILURE_WINDOW', 60))
+AUTH_FAILURE_SOURCES = int(os.getenv('AUTH_FAILURE_SOURCES', 10000))
+
+
+class FailureLimiter(object):
+    """Counts failed authentications per source in fixed windows
+
+    A source that fails more than limit times within window seconds is
+    throttled until the window ends. Only the most recently seen max_sources
+    sources are tracked, so a flood of distinct addresses can't grow it
+    without bound.
+    """
+    def __init__(self, limit=AUTH_FAILURE_LIMIT, window=AUTH_FAILURE_WINDOW,
+                 max_sources=AUTH_FAILURE_SOURCES):
+        self.limit = limit
+        self.window = window
+        self.max_sources = max_sources
+        self._windows = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, source):
+        now = time.monotonic()
+        with self._lock:
+            started, failures = self._windows.get(source, (now, 0))
+            if now - started >= self.window:
+                started, failures = now, 0
+            self._windows[source] = (started, failures + 1)
+            self._windows.move_to_end(source)
+            while len(self._windows) > self.max_sources:
+                self._windows.popitem(last=False)
+
+    def is_throttled(self, source):
+        if self.limit <= 0:
+            return False
+        entry = self._windows.get(source)
+        if entry is None:
+            return False
+        started, failures = entry
+        return failures >= self.limit and \
+            time.monotonic() - started < self.window
+
+    def clear(self):
+        with self._lock:
+            self._windows.clear()
@@ -0,0 +1,82 @@
+import hashlib
+import os
+import threading
+import time
+
+from collections import OrderedDict
+
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', 1024))
+
+
+def token_digest(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+class TokenCache(object):
+    """Bounded LRU of already verified token payloads
+
+    Entries are keyed by a digest of the raw token, so the tokens themselves
+    are never held in memory, and each entry is dropped once the token's exp
+    claim has passed. A token that was verified once is trusted until it
+    expires, even if its signing key is rotated out of the JWKS in the
+    meantime.
+    """
+    def __init__(self, maxsize=TOKEN_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        key = token_digest(token)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now >= entry[1]:
+                del self._entries[key]
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def __contains__(self, token):
+        """Checks for an unexpired entry without touching the counters or
+        the LRU order"""
+        entry = self._entries.get(token_digest(token))
+        return entry is not None and time.time() < entry[1]
+
+    def set(self, token, payload, expires_at=None):
+        """Caches payload until expires_at (epoch seconds), which defaults to
+        the payload's exp claim"""
+        if expires_at is None:
+            expires_at = payload.get('exp')
+        if not isinstance(expires_at, (int, float)) or self.maxsize <= 0:
+            return
+
+        key = token_digest(token)
+        with self._lock:
+            self._entries[key] = (payload, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._entries),
+            'maxsize': self.maxsize
+        }
@@ -2,6 +2,7 @@ from flask import Flask
 from flask_cors import CORS
 from flask_migrate import Migrate
 from flask_sqlalchemy import SQLAlchemy
+from werkzeug.middleware.proxy_fix import ProxyFix
 
 from config import Config
 
@@ -14,6 +15,10 @@ def create_app(config_class=Config):
     app.config.from_object(config_class)
     CORS(app)
 
+    if app.config['PROXY_FIX_X_FOR']:
+        app.wsgi_app = ProxyFix(app.wsgi_app,
+                                x_for=app.config['PROXY_FIX_X_FOR'])
+
     db.init_app(app)
     migrate.init_app(app, db)
 
@@ -27,9 +32,32 @@ def create_app(config_class=Config):
     from .agents.agent_views import agents_bp
     app.register_blueprint(agents_bp)
 
+    from .league.league_views import league_bp
+    app.register_blueprint(league_bp)
+
     from .errors import errors_bp
     app.register_blueprint(errors_bp)
 
+    from .metrics.metrics_views import metrics_bp
+    app.register_blueprint(metrics_bp)
+
+    from auth.metrics import add_server_timing
+    app.after_request(add_server_timing)
+
+    # keep the JWKS warm so requests never wait on the identity provider
+    from auth.auth import jwks_store
+    if jwks_store.url and not app.testing:
+        jwks_store.start_refresher()
+
+    from auth.local_issuer import auth_cli
+    app.cli.add_command(auth_cli)
+
+    from .importer import import_cli
+    app.cli.add_command(import_cli)
+
+    from .payroll import payroll_cli
+    app.cli.add_command(payroll_cli)
+
     return app
 
 
@@ -5,20 +5,25 @@ from sqlalchemy.exc import IntegrityError
 
 from auth.auth import requires_auth
 from baseball_agency.agents import agents_bp
+from ..conditional import conditional
+from ..response_cache import cached
 from .helpers import valid_agent_body, valid_agent_patch_body
-from ..models import Player, Agent
+from ..models import db, Player, Agent, count_rows, format_row, \
+    projection
 
 
 @agents_bp.route('/agents', methods=['GET'])
 @requires_auth('get:agents')
+@conditional('agents')
+@cached('agents')
 def get_all_agents(jwt):
     try:
-        agents_query = Agent.query.all()
+        agents_query = Agent.query.with_entities(*projection(Agent)).all()
 
         if not agents_query:
             abort(404)
 
-        all_agents = [agent.format() for agent in agents_query]
+        all_agents = [format_row(Agent, row) for row in agents_query]
 
         return jsonify({
             'success': True,
@@ -32,6 +37,8 @@ def get_all_agents(jwt):
 
 @agents_bp.route('/agents/<int:agent_id>/details', methods=['GET'])
 @requires_auth('get:agent-details')
+@conditional('agents')
+@cached('agent:{agent_id}')
 def get_specific_agent_details(jwt, agent_id):
     try:
         agent = Agent.query.filter_by(id=agent_id).first_or_404()
@@ -47,19 +54,27 @@ def get_specific_agent_details(jwt, agent_id):
 
 @agents_bp.route('/agents/<int:agent_id>/clients', methods=['GET'])
 @requires_auth('get:agent-clients')
+@conditional('agents', 'players')
+@cached('agent:{agent_id}', 'clients:{agent_id}')
 def get_agent_clients(jwt, agent_id):
     try:
-        agent = Agent.query.filter_by(id=agent_id).first_or_404()
-
-        client_query = Player.query.filter_by(agent_id=agent.id).all()
+        # one round trip, see get_team_players
+        client_query = db.session.query(
+            Agent.name, *projection(Player)).outerjoin(
+            Player, Player.agent_id == Agent.id).filter(
+            Agent.id == agent_id).order_by(Player.id).all()
         if not client_query:
             abort(404)
 
-        clients = [player.format() for player in client_query]
+        agent_name = client_query[0][0]
+        clients = [format_row(Player, row[1:]) for row in client_query
+                   if row.id is not None]
+        if not clients:
+            abort(404)
 
         return jsonify({
             'success': True,
-            'agent': agent.name,
+            'agent': agent_name,
             'clients': clients,
             'total_agent_clients': len(clients)
         }), 200
@@ -84,7 +99,7 @@ def post_agent(jwt):
             'success': True,
             'new_agent_id': new_agent.id,
             'new_agent': new_agent.format_extended(),
-            'total_agents': len(Agent.query.all())
+            'total_agents': count_rows(Agent)
         }), 201
 
     except json.decoder.JSONDecodeError:
@@ -114,7 +129,7 @@ def delete_agent(jwt, agent_id):
         return jsonify({
             'success': True,
             'deleted_id': agent.id,
-            'total_agents': len(Agent.query.all())
+            'total_agents': count_rows(Agent)
         }), 200
 
     except IntegrityError:
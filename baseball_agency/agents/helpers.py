@@ -1,3 +1,6 @@
+from ..money import valid_money
+
+
 def valid_agent_body(body):
     is_valid = True
 
@@ -10,6 +13,9 @@ def valid_agent_body(body):
             if key not in body.keys() or body[key] == '':
                 is_valid = False
 
+        if not valid_money(body['salary']):
+            is_valid = False
+
     except ValueError:
         is_valid = False
     except KeyError:
@@ -34,4 +40,7 @@ def valid_agent_patch_body(body):
         if key not in possible_keys or body[key] == '':
             is_valid = False
 
+    if 'salary' in body and not valid_money(body['salary']):
+        is_valid = False
+
     return is_valid
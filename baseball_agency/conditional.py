@@ -0,0 +1,42 @@
+from functools import wraps
+
+from flask import current_app, g, make_response, request
+
+from baseball_agency.models import table_versions
+
+
+def versions_etag(tablenames):
+    versions = table_versions(*tablenames)
+    return '.'.join(f'{tablename}-{version}' for tablename, version
+                    in zip(tablenames, versions))
+
+
+def conditional(*tablenames):
+    """Adds an ETag made of the tables' versions to a GET view, and answers
+    a matching If-None-Match with 304 Not Modified without running the view
+
+    The versions are read before the view's queries, so a write landing in
+    between gives the response an older ETag than its body, and the next
+    poll simply gets a fresh 200. Goes below requires_auth, so callers
+    without permission never get a 304. The ETag is kept in g.versions_etag
+    for @cached, which goes below it, and a response that already has one
+    (a cached entry with the ETag it was stored with) keeps it.
+    """
+    def conditional_decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            etag = g.versions_etag = versions_etag(tablenames)
+
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+                response.set_etag(etag)
+                return response
+
+            response = make_response(f(*args, **kwargs))
+            if response.status_code == 200 and \
+                    response.get_etag()[0] is None:
+                response.set_etag(etag)
+            return response
+
+        return wrapper
+    return conditional_decorator
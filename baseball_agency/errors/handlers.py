@@ -59,6 +59,15 @@ def method_not_allowed(error):
     }), 405
 
 
+@errors_bp.app_errorhandler(429)
+def too_many_requests(error):
+    return jsonify({
+        "success": False,
+        "error": 429,
+        "message": error.description
+    }), 429
+
+
 @errors_bp.app_errorhandler(500)
 def internal_server_error(error):
     db.session.rollback()
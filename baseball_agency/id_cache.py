@@ -0,0 +1,56 @@
+import os
+import threading
+import time
+
+ID_CACHE_TTL = int(os.getenv('ID_CACHE_TTL', 0))
+
+
+class IdCache(object):
+    """Team and agent ids known to exist, so player validation can skip the
+    database for ids it has already seen
+
+    Only positive answers are cached: an id that isn't in the cache is
+    always checked against the database, so a team created by another
+    worker is never rejected. Models add ids on insert and discard them on
+    delete. Deletes made by other workers aren't seen, so everything is
+    forgotten every ttl seconds; until then the foreign key constraint still
+    rejects the write, and the player views answer its IntegrityError with
+    the same 400 as an unknown id. A ttl of 0 (the default) disables the
+    cache.
+    """
+    def __init__(self, ttl=ID_CACHE_TTL):
+        self.ttl = ttl
+        self._ids = {}
+        self._reset_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _expire(self):
+        if time.monotonic() - self._reset_at >= self.ttl:
+            self._ids.clear()
+            self._reset_at = time.monotonic()
+
+    def __contains__(self, key):
+        """key is a (tablename, id) pair"""
+        if self.ttl <= 0:
+            return False
+        with self._lock:
+            self._expire()
+            return key[1] in self._ids.get(key[0], ())
+
+    def add(self, tablename, id):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._expire()
+            self._ids.setdefault(tablename, set()).add(id)
+
+    def discard(self, tablename, id):
+        with self._lock:
+            self._ids.get(tablename, set()).discard(id)
+
+    def clear(self):
+        with self._lock:
+            self._ids.clear()
+
+
+id_cache = IdCache()
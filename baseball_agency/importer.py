@@ -0,0 +1,230 @@
+import csv
+import io
+import json
+import os
+import time
+
+import click
+from flask.cli import AppGroup
+
+from baseball_agency import db
+from baseball_agency.models import apply_payroll_deltas, bump_versions, \
+    fill_cents, payroll_deltas, Agent, Player, Team
+from baseball_agency.response_cache import response_cache
+
+IMPORT_BATCH_SIZE = 10000
+
+# maintained from other tables, flask payroll verify --fix recomputes them
+COMPUTED_COLUMNS = {
+    'teams': {'total_payroll_cents': 'the players\' salaries'}
+}
+
+
+class InvalidImport(click.ClickException):
+    pass
+
+
+def read_records(path, file_format=None):
+    """Streams dicts from a CSV file with a header row, or from a file of
+    newline delimited json objects (.ndjson, .jsonl)"""
+    if file_format is None:
+        extension = os.path.splitext(path)[1].lower()
+        file_format = 'ndjson' if extension in ('.ndjson', '.jsonl') else \
+            'csv'
+
+    with open(path, newline='') as import_file:
+        if file_format == 'csv':
+            for record in csv.DictReader(import_file):
+                yield record
+        else:
+            for number, line in enumerate(import_file, 1):
+                if line.strip():
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        raise InvalidImport(f'line {number}: invalid json')
+
+
+def import_columns(model, records):
+    """The model's columns the file provides, taken from its first record"""
+    first = next(records, None)
+    if first is None:
+        return [], records
+    if not isinstance(first, dict):
+        raise InvalidImport('record 1: expected an object')
+
+    for column, source in COMPUTED_COLUMNS.get(model.__tablename__,
+                                               {}).items():
+        if column in first:
+            raise InvalidImport(f'{column} is computed from {source}, remove '
+                                f'it from the file')
+
+    # the cents are parsed from the money strings when a file only has those
+    provided = set(first) | {cents_column for column, cents_column
+                             in model.money_columns.items()
+                             if column in first}
+    columns = [column for column in model.__table__.columns
+               if column.name in provided]
+    missing = [column.name for column in model.__table__.columns
+               if column.name not in first and not column.primary_key and
+               not column.nullable and column.server_default is None]
+    if missing:
+        raise InvalidImport(
+            f'missing required columns: {", ".join(missing)}')
+
+    def chained():
+        yield first
+        yield from records
+
+    return columns, chained()
+
+
+def convert(columns, record, number):
+    if not isinstance(record, dict):
+        raise InvalidImport(f'record {number}: expected an object')
+
+    row = {}
+    for column in columns:
+        value = record.get(column.name)
+        if value == '' or value is None:
+            if not column.nullable and not column.primary_key:
+                raise InvalidImport(
+                    f'record {number}: {column.name} is required')
+            value = None
+        elif isinstance(column.type, db.Integer):
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                raise InvalidImport(f'record {number}: {column.name} must '
+                                    f'be an integer')
+        else:
+            value = str(value)
+        row[column.name] = value
+    return row
+
+
+def check_foreign_keys(model, batch, first_number):
+    """Checks the batch's team and agent ids with one lookup"""
+    if model is not Player:
+        return
+
+    from baseball_agency.players.helpers import find_existing_ids
+
+    team_ids, agent_ids = find_existing_ids(
+        {row['team_id'] for row in batch}, {row['agent_id'] for row in batch})
+
+    for offset, row in enumerate(batch):
+        if row['team_id'] not in team_ids:
+            raise InvalidImport(f'record {first_number + offset}: team_id '
+                                f'{row["team_id"]} does not exist')
+        if row['agent_id'] not in agent_ids:
+            raise InvalidImport(f'record {first_number + offset}: agent_id '
+                                f'{row["agent_id"]} does not exist')
+
+
+def copy_batch(model, columns, batch):
+    """Streams the batch into postgres with COPY ... FROM STDIN"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in batch:
+        writer.writerow(['' if row[column.name] is None else
+                         row[column.name] for column in columns])
+    buffer.seek(0)
+
+    names = ', '.join(column.name for column in columns)
+    cursor = db.session.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f'COPY {model.__tablename__} ({names}) FROM STDIN '
+                           f'WITH (FORMAT csv)', buffer)
+    finally:
+        cursor.close()
+
+
+def insert_batch(model, columns, batch):
+    db.session.execute(model.__table__.insert(), batch)
+
+
+def import_records(model, records, batch_size=IMPORT_BATCH_SIZE,
+                   progress=None):
+    """Loads records into model's table in one transaction, COPY on postgres
+    and batched executemany INSERTs elsewhere. Returns the rows loaded.
+
+    Nothing is committed if any record is invalid."""
+    records = iter(records)
+    columns, records = import_columns(model, records)
+    if not columns:
+        return 0
+
+    postgres = db.session.get_bind().dialect.name == 'postgresql'
+    load_batch = copy_batch if postgres else insert_batch
+    total = 0
+    batch = []
+
+    def flush():
+        check_foreign_keys(model, batch, total - len(batch) + 1)
+        load_batch(model, columns, batch)
+        if model is Player:
+            apply_payroll_deltas(payroll_deltas(batch))
+        if progress is not None:
+            progress(total)
+
+    try:
+        for record in records:
+            total += 1
+            batch.append(fill_cents(model, convert(columns, record,
+                                                   total)))
+            if len(batch) >= batch_size:
+                flush()
+                batch = []
+        if batch:
+            flush()
+
+        # explicit ids don't advance the serial sequence
+        if postgres and any(column.primary_key for column in columns):
+            db.session.execute(db.text(
+                f"SELECT setval(pg_get_serial_sequence("
+                f"'{model.__tablename__}', 'id'), "
+                f"(SELECT max(id) FROM {model.__tablename__}))"))
+
+        bump_versions(model.__tablename__)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    response_cache.clear()
+
+    return total
+
+
+import_cli = AppGroup('import', help='Bulk load players, teams and agents.')
+
+
+def import_command(name, model):
+    def command(path, file_format, batch_size):
+        started = time.perf_counter()
+
+        def progress(total):
+            elapsed = time.perf_counter() - started
+            click.echo(f'{total} rows, {total / elapsed:.0f} rows/s')
+
+        total = import_records(model, read_records(path, file_format),
+                               batch_size=batch_size, progress=progress)
+        elapsed = time.perf_counter() - started
+        click.echo(f'imported {total} {name} in {elapsed:.2f}s '
+                   f'({total / max(elapsed, 1e-9):.0f} rows/s)')
+
+    command.__doc__ = f'Loads {name} from a CSV or NDJSON file.'
+
+    command = click.option('--batch-size', default=IMPORT_BATCH_SIZE,
+                           show_default=True)(command)
+    command = click.option('--format', 'file_format', type=click.Choice(
+        ['csv', 'ndjson']), help='Defaults to the file extension.')(command)
+    command = click.argument('path', type=click.Path(
+        exists=True, dir_okay=False))(command)
+    return import_cli.command(name)(command)
+
+
+import_command('players', Player)
+import_command('teams', Team)
+import_command('agents', Agent)
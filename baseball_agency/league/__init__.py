@@ -0,0 +1,5 @@
+from flask import Blueprint
+
+league_bp = Blueprint('league', __name__)
+
+from baseball_agency.league import league_views  # noqa
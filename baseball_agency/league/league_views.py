@@ -0,0 +1,73 @@
+from flask import jsonify
+from sqlalchemy import func
+
+from auth.auth import requires_auth
+from baseball_agency.league import league_bp
+from ..conditional import conditional
+from ..models import db, Agent, Player, Team
+from ..money import format_money
+from ..response_cache import cached
+
+
+@league_bp.route('/league/summary', methods=['GET'])
+@requires_auth(['get:team-details', 'get:agent-clients'])
+@conditional('teams', 'agents', 'players')
+@cached('teams', 'agents', 'players')
+def get_league_summary(jwt):
+    try:
+        # one GROUP BY per section instead of a roster and client list
+        # request per team and agent. Payrolls are the teams' maintained
+        # totals, so players is only scanned for the counts.
+        team_query = db.session.query(
+            Team.id, Team.name, Team.abbr, Team.total_payroll_cents,
+            func.count(Player.id)).outerjoin(
+            Player, Player.team_id == Team.id).group_by(
+            Team.id).order_by(Team.id).all()
+
+        agent_query = db.session.query(
+            Agent.id, Agent.name, func.count(Player.id)).outerjoin(
+            Player, Player.agent_id == Agent.id).group_by(
+            Agent.id).order_by(Agent.id).all()
+
+        position_query = db.session.query(
+            Player.position, func.count()).group_by(
+            Player.position).order_by(
+            func.count().desc(), Player.position).all()
+
+        teams = [{
+            'id': id,
+            'name': name,
+            'abbr': abbr,
+            'total_players': total_players,
+            'total_payroll': format_money(payroll),
+            'total_payroll_cents': payroll
+        } for id, name, abbr, payroll, total_players in team_query]
+
+        agents = [{
+            'id': id,
+            'name': name,
+            'total_clients': total_clients
+        } for id, name, total_clients in agent_query]
+
+        positions = [{
+            'position': position,
+            'total_players': total_players
+        } for position, total_players in position_query]
+
+        league_payroll = sum(team['total_payroll_cents'] for team in teams)
+
+        return jsonify({
+            'success': True,
+            'teams': teams,
+            'agents': agents,
+            'positions': positions,
+            'total_teams': len(teams),
+            'total_agents': len(agents),
+            'total_players': sum(position['total_players']
+                                 for position in positions),
+            'total_payroll': format_money(league_payroll),
+            'total_payroll_cents': league_payroll
+        }), 200
+
+    except Exception as error:
+        raise error
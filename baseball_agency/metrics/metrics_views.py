@@ -0,0 +1,29 @@
+from flask import Response
+
+from auth.metrics import render_counter, render_metrics
+from baseball_agency.metrics import metrics_bp
+from ..response_cache import response_cache
+
+RESPONSE_CACHE_COUNTERS = (
+    ('hits', 'GET responses served from the response cache.'),
+    ('misses', 'GET responses not found in the response cache.'),
+    ('stale_hits', 'Expired GET responses served while another request '
+                   'refreshed them.'),
+    ('coalesced', 'GET responses shared with an identical in flight '
+                  'request.')
+)
+
+
+def render_response_cache_metrics():
+    stats = response_cache.stats()
+    lines = []
+    for name, description in RESPONSE_CACHE_COUNTERS:
+        lines += render_counter(f'response_cache_{name}_total', description,
+                                stats[name])
+    return '\n'.join(lines) + '\n'
+
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(render_metrics() + render_response_cache_metrics(), 200,
+                    mimetype='text/plain; version=0.0.4')
@@ -1,4 +1,12 @@
+from collections import Counter
+
+from sqlalchemy import bindparam, event, func
+from sqlalchemy.orm import column_property
+
 from baseball_agency import db
+from baseball_agency.id_cache import id_cache
+from baseball_agency.money import format_money, money_value
+from baseball_agency.response_cache import response_cache
 
 
 def db_drop_and_create_all():
@@ -8,21 +16,134 @@ def db_drop_and_create_all():
     """
     db.drop_all()
     db.create_all()
+    id_cache.clear()
+    response_cache.clear()
+
+
+def count_rows(model, *criteria):
+    """
+    SELECT count(*) on the model's table, optionally filtered by criteria,
+    without loading any rows.
+    """
+    return db.session.query(func.count()).select_from(model).filter(
+        *criteria).scalar()
+
+
+def bump_versions(*tablenames):
+    """
+    Increments the tables' versions in the current transaction, so they
+    change exactly when the write commits. Every write to these tables must
+    call it, or conditional GETs will serve stale 304s.
+    """
+    db.session.query(TableVersion).filter(
+        TableVersion.name.in_(tablenames)).update(
+        {TableVersion.version: TableVersion.version + 1},
+        synchronize_session=False)
+
+
+def table_versions(*tablenames):
+    """
+    Current versions of the tables, in one query.
+    """
+    versions = dict(db.session.query(TableVersion.name, TableVersion.version)
+                    .filter(TableVersion.name.in_(tablenames)))
+    return [versions.get(tablename, 0) for tablename in tablenames]
+
+
+def apply_payroll_deltas(deltas):
+    """
+    Adds {team_id: cents} to the teams' payroll in the current transaction,
+    as increments in one executemany, so concurrent player writes to the
+    same team never overwrite each other. Returns the cache tags to
+    invalidate once committed.
+    """
+    deltas = {team_id: delta for team_id, delta in deltas.items()
+              if team_id is not None and delta}
+    if not deltas:
+        return []
+
+    db.session.execute(
+        Team.__table__.update().where(
+            Team.id == bindparam('team_id')).values(
+            total_payroll_cents=Team.total_payroll_cents +
+            bindparam('delta')),
+        [{'team_id': team_id, 'delta': delta}
+         for team_id, delta in sorted(deltas.items())])
+    bump_versions('teams')
+    return [f'team:{team_id}' for team_id in sorted(deltas)]
+
+
+def payroll_deltas(players):
+    """
+    {team_id: cents} added by inserting a list of player column dicts.
+    """
+    deltas = Counter()
+    for player in players:
+        deltas[player['team_id']] += player.get('salary_cents') or 0
+    return deltas
+
+
+def fill_cents(model, row):
+    """
+    Fills in the cents columns of a column dict that only has the money
+    strings, for inserts that bypass the models' validators.
+    """
+    for column, cents_column in model.money_columns.items():
+        if row.get(cents_column) is None and row.get(column) is not None:
+            row[column], row[cents_column] = money_value(row[column])
+    return row
+
+
+def projection(model, extended=False):
+    """
+    The columns behind model.format() (or format_extended()), for queries
+    that only read and serialize rows.
+    """
+    fields = model.extended_format_fields if extended else \
+        model.format_fields
+    return [getattr(model, field) for field in fields
+            if field not in model.derived_fields]
+
+
+def format_row(model, row, extended=False):
+    """
+    Same dict as model.format() (or format_extended()), built from a row of
+    projection(model) columns without hydrating an ORM instance.
+    """
+    fields = model.extended_format_fields if extended else \
+        model.format_fields
+    values = dict(zip([field for field in fields
+                       if field not in model.derived_fields], row))
+    return {field: model.derived_fields[field](values)
+            if field in model.derived_fields else values[field]
+            for field in fields}
 
 
 class Player(db.Model):
     __tablename__ = 'players'
 
+    format_fields = ('id', 'name', 'number', 'position', 'team_id')
+    extended_format_fields = format_fields + ('agent_id', 'salary',
+                                              'salary_cents')
+    money_columns = {'salary': 'salary_cents'}
+    derived_fields = {}
+
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String)
+    # indexed for sort=name
+    name = db.Column(db.String, index=True)
     number = db.Column(db.String)
-    position = db.Column(db.String)
+    position = db.Column(db.String, index=True)
     salary = db.Column(db.String)
-
-    team_id = db.Column(db.Integer, db.ForeignKey('teams.id'),
-                        nullable=False)
+    # active_history loads the previous values when they're replaced, so
+    # payroll_deltas() knows what to take off the previous team
+    salary_cents = column_property(db.Column(db.BigInteger),
+                                   active_history=True)
+
+    team_id = column_property(
+        db.Column(db.Integer, db.ForeignKey('teams.id'), nullable=False,
+                  index=True), active_history=True)
     agent_id = db.Column(db.Integer, db.ForeignKey('agents.id'),
-                         nullable=False)
+                         nullable=False, index=True)
 
     team = db.relationship(
         'Team', backref=db.backref('player'))
@@ -41,96 +162,179 @@ class Player(db.Model):
         return f'{self.name} is a baseball player. His number is' \
                f' {self.number} and his position is {self.position}.'
 
+    @db.validates('salary')
+    def validate_salary(self, key, salary):
+        salary, self.salary_cents = money_value(salary)
+        return salary
+
     def insert(self):
+        cache_tags = self.cache_tags()
+        payroll = self.payroll_deltas()
         db.session.add(self)
+        bump_versions('players')
+        cache_tags += apply_payroll_deltas(payroll)
         db.session.commit()
+        response_cache.invalidate(*cache_tags)
 
     def delete(self):
+        cache_tags = self.cache_tags()
+        payroll = self.payroll_deltas(deleting=True)
         db.session.delete(self)
+        bump_versions('players')
+        cache_tags += apply_payroll_deltas(payroll)
         db.session.commit()
+        response_cache.invalidate(*cache_tags)
 
     def update(self):
+        cache_tags = self.cache_tags()
+        payroll = self.payroll_deltas()
+        bump_versions('players')
+        cache_tags += apply_payroll_deltas(payroll)
         db.session.commit()
+        response_cache.invalidate(*cache_tags)
+
+    def payroll_deltas(self, deleting=False):
+        """{team_id: cents} the pending insert, change or (deleting) delete
+        of this player adds to the teams' payroll: its salary comes off its
+        previous team and goes on its current one"""
+        deltas = Counter()
+        state = db.inspect(self)
+
+        if state.persistent:
+            # load_history() loads them if a commit expired the instance
+            team_id, salary_cents = (
+                (history.deleted or history.unchanged or [None])[0]
+                for history in (state.attrs.team_id.load_history(),
+                                state.attrs.salary_cents.load_history()))
+            deltas[team_id] -= salary_cents or 0
+
+        if not deleting:
+            deltas[self.team_id] += self.salary_cents or 0
+
+        return deltas
+
+    def cache_tags(self):
+        """Tags of the cached responses showing this player: the player
+        lists, its details, and the rosters and client lists of both its
+        current and, when there's a pending change, its previous team and
+        agent"""
+        attributes = db.inspect(self).attrs
+        team_ids = {id for id in attributes.team_id.history.sum()
+                    if id is not None}
+        agent_ids = {id for id in attributes.agent_id.history.sum()
+                     if id is not None}
+
+        return ['players', f'player:{self.id}'] + \
+            [f'roster:{id}' for id in team_ids] + \
+            [f'clients:{id}' for id in agent_ids]
+
+    @classmethod
+    def insert_many(cls, players):
+        """Inserts a list of column dicts with a single executemany, in one
+        transaction, without building ORM instances"""
+        players = [fill_cents(cls, dict(player)) for player in players]
+        db.session.execute(cls.__table__.insert(), players)
+        bump_versions(cls.__tablename__)
+        payroll_tags = apply_payroll_deltas(payroll_deltas(players))
+        db.session.commit()
+        response_cache.invalidate(
+            'players',
+            *{f'roster:{player["team_id"]}' for player in players},
+            *{f'clients:{player["agent_id"]}' for player in players},
+            *payroll_tags)
 
     def format(self):
-        return {
-            'id': self.id,
-            'name': self.name,
-            'number': self.number,
-            'position': self.position,
-            'team_id': self.team_id
-        }
+        return {field: getattr(self, field)
+                for field in self.format_fields}
 
     def format_extended(self):
-        return {
-            'id': self.id,
-            'name': self.name,
-            'number': self.number,
-            'position': self.position,
-            'team_id': self.team_id,
-            'agent_id': self.agent_id,
-            'salary': self.salary
-        }
+        return {field: getattr(self, field)
+                for field in self.extended_format_fields}
+
+
+# serves the case insensitive name prefix filter on GET /players
+db.Index('ix_players_lower_name', func.lower(Player.name))
 
 
 class Team(db.Model):
     __tablename__ = 'teams'
 
+    format_fields = ('id', 'name', 'abbr', 'city', 'state')
+    extended_format_fields = format_fields + ('total_payroll',
+                                              'total_payroll_cents')
+    money_columns = {}
+    # format fields computed from the stored ones
+    derived_fields = {
+        'total_payroll': lambda team: format_money(
+            team['total_payroll_cents'])
+    }
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
     abbr = db.Column(db.String)
     city = db.Column(db.String)
     state = db.Column(db.String)
-    total_payroll = db.Column(db.String)
+    # the sum of the players' salary_cents, kept up to date by the players'
+    # writes (see apply_payroll_deltas) and checked by flask payroll verify
+    total_payroll_cents = db.Column(db.BigInteger, nullable=False, default=0,
+                                    server_default='0')
 
-    def __init__(self, name, abbr, city, state, total_payroll):
+    def __init__(self, name, abbr, city, state):
         self.name = name
         self.abbr = abbr
         self.city = city
         self.state = state
-        self.total_payroll = total_payroll
 
     def __repr__(self):
         return f'The {self.name} ({self.abbr}) are based in ' \
                f'{self.city}, {self.state}.'
 
+    @property
+    def total_payroll(self):
+        return format_money(self.total_payroll_cents or 0)
+
     def insert(self):
         db.session.add(self)
+        bump_versions('teams')
         db.session.commit()
+        id_cache.add(self.__tablename__, self.id)
+        response_cache.invalidate('teams')
 
     def delete(self):
+        id = self.id
+        id_cache.discard(self.__tablename__, id)
         db.session.delete(self)
+        bump_versions('teams')
         db.session.commit()
+        response_cache.invalidate('teams', f'team:{id}', f'roster:{id}')
 
     def update(self):
+        id = self.id
+        bump_versions('teams')
         db.session.commit()
+        response_cache.invalidate('teams', f'team:{id}')
 
     def format(self):
-        return {
-            'id': self.id,
-            'name': self.name,
-            'abbr': self.abbr,
-            'city': self.city,
-            'state': self.state
-        }
+        return {field: getattr(self, field)
+                for field in self.format_fields}
 
     def format_extended(self):
-        return {
-            'id': self.id,
-            'name': self.name,
-            'abbr': self.abbr,
-            'city': self.city,
-            'state': self.state,
-            'total_payroll': self.total_payroll
-        }
+        return {field: getattr(self, field)
+                for field in self.extended_format_fields}
 
 
 class Agent(db.Model):
     __tablename__ = 'agents'
 
+    format_fields = ('id', 'name')
+    extended_format_fields = format_fields + ('salary', 'salary_cents')
+    money_columns = {'salary': 'salary_cents'}
+    derived_fields = {}
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
     salary = db.Column(db.String)
+    salary_cents = db.Column(db.BigInteger)
 
     def __init__(self, name, salary):
         self.name = name
@@ -139,26 +343,59 @@ class Agent(db.Model):
     def __repr__(self):
         return f'{self.name} is a baseball player agent.'
 
+    @db.validates('salary')
+    def validate_salary(self, key, salary):
+        salary, self.salary_cents = money_value(salary)
+        return salary
+
     def insert(self):
         db.session.add(self)
+        bump_versions('agents')
         db.session.commit()
+        id_cache.add(self.__tablename__, self.id)
+        response_cache.invalidate('agents')
 
     def delete(self):
+        id = self.id
+        id_cache.discard(self.__tablename__, id)
         db.session.delete(self)
+        bump_versions('agents')
         db.session.commit()
+        response_cache.invalidate('agents', f'agent:{id}', f'clients:{id}')
 
     def update(self):
+        id = self.id
+        bump_versions('agents')
         db.session.commit()
+        response_cache.invalidate('agents', f'agent:{id}')
 
     def format(self):
-        return {
-            'id': self.id,
-            'name': self.name
-        }
+        return {field: getattr(self, field)
+                for field in self.format_fields}
 
     def format_extended(self):
-        return {
-            'id': self.id,
-            'name': self.name,
-            'salary': self.salary
-        }
+        return {field: getattr(self, field)
+                for field in self.extended_format_fields}
+
+
+class TableVersion(db.Model):
+    """
+    A counter per table, bumped by every write to it, which the conditional
+    GET endpoints use as their ETag.
+    """
+    __tablename__ = 'table_versions'
+
+    name = db.Column(db.String, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'{self.name} is at version {self.version}.'
+
+
+VERSIONED_TABLES = ('players', 'teams', 'agents')
+
+
+@event.listens_for(TableVersion.__table__, 'after_create')
+def create_table_versions(target, connection, **kw):
+    connection.execute(target.insert(), [
+        {'name': tablename, 'version': 0} for tablename in VERSIONED_TABLES])
@@ -0,0 +1,81 @@
+import re
+
+from decimal import Decimal, ROUND_HALF_UP
+
+MONEY_PATTERN = re.compile(
+    r'^\$?\s*(?P<amount>\d[\d,]*(?:\.\d+)?)\s*'
+    r'(?P<scale>thousand|million|billion|k|m|b)?\s*(?:usd)?$',
+    re.IGNORECASE)
+
+SCALES = {
+    '': 1,
+    'k': 10 ** 3,
+    'thousand': 10 ** 3,
+    'm': 10 ** 6,
+    'million': 10 ** 6,
+    'b': 10 ** 9,
+    'billion': 10 ** 9
+}
+
+
+def parse_money(value):
+    """Cents for a USD amount, given as a number of dollars or a string like
+    '583,500 USD', '1.1 million USD' or '$2.5M'. Raises ValueError for
+    anything else, including negative amounts."""
+    if isinstance(value, bool):
+        raise ValueError(f'not a USD amount: {value!r}')
+
+    if isinstance(value, (int, float, Decimal)):
+        dollars = Decimal(str(value))
+    elif isinstance(value, str):
+        match = MONEY_PATTERN.match(value.strip())
+        if match is None:
+            raise ValueError(f'not a USD amount: {value!r}')
+        dollars = Decimal(match.group('amount').replace(',', '')) * \
+            SCALES[(match.group('scale') or '').lower()]
+    else:
+        raise ValueError(f'not a USD amount: {value!r}')
+
+    if not dollars.is_finite() or dollars < 0:
+        raise ValueError(f'not a USD amount: {value!r}')
+
+    return int((dollars * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def format_money(cents):
+    """Formats cents the way the seed data writes amounts, '583,500 USD'
+    under a million dollars and '8.3 million USD' from there"""
+    dollars = Decimal(cents) / 100
+    if dollars >= 10 ** 6:
+        return f'{(dollars / 10 ** 6).normalize():f} million USD'
+    if dollars == dollars.to_integral_value():
+        return f'{int(dollars):,} USD'
+    return f'{dollars:,.2f} USD'
+
+
+def money_value(value):
+    """Returns the (string, cents) pair stored for a salary or payroll
+
+    Numbers are dollars, and get the formatted string. Strings are stored as
+    given, with NULL cents if they don't parse, so clients still sending
+    free form strings keep working while they move to amounts.
+    """
+    if isinstance(value, str):
+        try:
+            return value, parse_money(value)
+        except ValueError:
+            return value, None
+
+    cents = parse_money(value)
+    return format_money(cents), cents
+
+
+def valid_money(value):
+    """A non-empty string, or a non-negative number of dollars"""
+    if isinstance(value, str):
+        return value != ''
+    try:
+        parse_money(value)
+    except ValueError:
+        return False
+    return True
@@ -0,0 +1,67 @@
+import click
+from flask.cli import AppGroup
+from sqlalchemy import bindparam, func
+
+from baseball_agency import db
+from baseball_agency.models import bump_versions, Player, Team
+from baseball_agency.money import format_money
+from baseball_agency.response_cache import response_cache
+
+
+def payroll_mismatches():
+    """Recomputes every team's payroll from its players' salaries in one
+    GROUP BY, and returns (team_id, name, stored, actual) for the teams whose
+    maintained total_payroll_cents differs. Salaries that aren't amounts
+    (NULL salary_cents) count as 0, as they do for the maintained value."""
+    payrolls = db.session.query(
+        Player.team_id,
+        func.sum(Player.salary_cents).label('payroll')).group_by(
+        Player.team_id).subquery()
+
+    teams = db.session.query(
+        Team.id, Team.name, Team.total_payroll_cents,
+        func.coalesce(payrolls.c.payroll, 0)).outerjoin(
+        payrolls, payrolls.c.team_id == Team.id).order_by(Team.id)
+
+    return [(id, name, stored, actual) for id, name, stored, actual in teams
+            if stored != actual]
+
+
+def fix_payrolls(mismatches):
+    """Overwrites the teams' payroll with the recomputed values"""
+    db.session.execute(
+        Team.__table__.update().where(Team.id == bindparam('team_id')).values(
+            total_payroll_cents=bindparam('payroll')),
+        [{'team_id': id, 'payroll': actual}
+         for id, _, _, actual in mismatches])
+    bump_versions('teams')
+    db.session.commit()
+    # 'teams' covers the responses listing every team's payroll, like the
+    # league summary
+    response_cache.invalidate('teams', *[f'team:{id}'
+                                         for id, _, _, _ in mismatches])
+
+
+payroll_cli = AppGroup('payroll', help='Check the teams\' payroll.')
+
+
+@payroll_cli.command('verify')
+@click.option('--fix', is_flag=True,
+              help='Overwrite the payrolls that don\'t match.')
+def verify_command(fix):
+    """Recomputes every team's payroll from its players' salaries and
+    compares it to the maintained value. Exits with 1 if any differ and
+    --fix isn't given."""
+    mismatches = payroll_mismatches()
+
+    for id, name, stored, actual in mismatches:
+        click.echo(f'team {id} ({name}): {format_money(stored)} maintained, '
+                   f'{format_money(actual)} from its players')
+
+    if not mismatches:
+        click.echo('every team\'s payroll matches its players')
+    elif fix:
+        fix_payrolls(mismatches)
+        click.echo(f'fixed {len(mismatches)} teams')
+    else:
+        raise click.exceptions.Exit(1)
@@ -1,54 +1,79 @@
+from sqlalchemy import literal
 from sqlalchemy.exc import IntegrityError
 
-from ..models import Agent, Team
+from ..id_cache import id_cache
+from ..money import valid_money
+from ..models import db, Agent, Team
 
 
-def check_valid_agent_id(id):
-    is_valid = True
-    valid_agent_ids = [agent.id for agent in Agent.query.all()]
+def check_valid_ids(team_id=None, agent_id=None):
+    """Checks that the given team and agent ids exist, in one round trip
+    of primary key lookups for the ids the id cache doesn't know"""
+    lookups = []
+    for model, id in ((Team, team_id), (Agent, agent_id)):
+        if id is None:
+            continue
+        # before the cache lookup, which can't hash a list or dict
+        if not isinstance(id, int):
+            return False
+        if (model.__tablename__, id) in id_cache:
+            continue
+        lookups.append((model, id))
 
-    if id not in valid_agent_ids:
-        is_valid = False
+    if not lookups:
+        return True
 
-    return is_valid
+    found = db.session.query(*[
+        model.query.filter(model.id == id).exists()
+        for model, id in lookups]).one()
 
+    for (model, id), exists in zip(lookups, found):
+        if not exists:
+            return False
+        id_cache.add(model.__tablename__, id)
 
-def check_valid_team_id(id):
-    is_valid = True
-    valid_team_ids = [team.id for team in Team.query.all()]
+    return True
 
-    if id not in valid_team_ids:
-        is_valid = False
 
-    return is_valid
+PLAYER_STRING_KEYS = ['name', 'position', 'number']
 
+PLAYER_INTEGER_KEYS = ['agent_id', 'team_id']
 
-def valid_player_body(body):
+# salary is a string like '583,500 USD' or a number of dollars
+PLAYER_MONEY_KEYS = ['salary']
+
+
+def valid_player_fields(body):
+    """Checks a new player body has every field with the right type, without
+    looking up its team and agent"""
     is_valid = True
 
-    string_keys = [
-        'name', 'position', 'salary', 'number'
-    ]
+    for key in PLAYER_STRING_KEYS:
+        if key not in body.keys() or body[key] == '' or not isinstance(
+                body[key], str):
+            is_valid = False
 
-    integer_keys = [
-        'agent_id', 'team_id'
-    ]
+    for key in PLAYER_INTEGER_KEYS:
+        if key not in body.keys() or body[key] == 0 or not isinstance(
+                body[key], int):
+            is_valid = False
 
-    try:
-        for key in string_keys:
-            if key not in body.keys() or body[key] == '' or not isinstance(
-                    body[key], str):
-                is_valid = False
+    for key in PLAYER_MONEY_KEYS:
+        if key not in body.keys() or not valid_money(body[key]):
+            is_valid = False
+
+    return is_valid
 
-        for key in integer_keys:
-            if key not in body.keys() or body[key] == 0 or not isinstance(
-                    body[key], int):
-                is_valid = False
 
-        if not check_valid_agent_id(body['agent_id']):
+def valid_player_body(body):
+    is_valid = True
+
+    try:
+        if not valid_player_fields(body):
             is_valid = False
 
-        if not check_valid_team_id(body['team_id']):
+        elif not check_valid_ids(team_id=body['team_id'],
+                                 agent_id=body['agent_id']):
             is_valid = False
 
     except ValueError:
@@ -61,6 +86,27 @@ def valid_player_body(body):
     return is_valid
 
 
+def find_existing_ids(team_ids, agent_ids):
+    """Returns the subsets of team_ids and agent_ids that exist, looking up
+    the ones the id cache doesn't know in a single query"""
+    existing = {}
+    queries = []
+    for model, ids in ((Team, team_ids), (Agent, agent_ids)):
+        tablename = model.__tablename__
+        existing[tablename] = {id for id in ids if (tablename, id) in id_cache}
+        unknown = set(ids) - existing[tablename]
+        if unknown:
+            queries.append(db.session.query(
+                literal(tablename), model.id).filter(model.id.in_(unknown)))
+
+    if queries:
+        for tablename, id in queries[0].union_all(*queries[1:]):
+            existing[tablename].add(id)
+            id_cache.add(tablename, id)
+
+    return existing['teams'], existing['agents']
+
+
 def valid_player_patch_body(body):
     # separate function to check patch body
     is_valid = True
@@ -76,12 +122,11 @@ def valid_player_patch_body(body):
         if key not in possible_keys or body[key] == '':
             is_valid = False
 
-    if 'team_id' in body:
-        if not check_valid_team_id(body['team_id']):
-            return IntegrityError
+    if 'salary' in body and not valid_money(body['salary']):
+        is_valid = False
 
-    if 'agent_id' in body:
-        if not check_valid_agent_id(body['agent_id']):
-            return IntegrityError
+    if is_valid and not check_valid_ids(team_id=body.get('team_id'),
+                                        agent_id=body.get('agent_id')):
+        return IntegrityError
 
     return is_valid
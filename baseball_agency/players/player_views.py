@@ -1,27 +1,146 @@
+import base64
+import csv
+import io
 import json
 
-from flask import jsonify, request, abort
+from flask import jsonify, request, abort, Response, stream_with_context
+from sqlalchemy import func
 from sqlalchemy.exc import IntegrityError
 
 from auth.auth import requires_auth
 from baseball_agency.players import players_bp
-from .helpers import valid_player_body, valid_player_patch_body
-from ..models import Player
+from ..conditional import conditional
+from ..response_cache import cached
+from .helpers import find_existing_ids, valid_player_body, \
+    valid_player_fields, valid_player_patch_body, PLAYER_INTEGER_KEYS, \
+    PLAYER_MONEY_KEYS, PLAYER_STRING_KEYS
+from ..models import db, Player, count_rows, format_row, projection
 
 PLAYERS_PER_PAGE = 10
+MAX_PLAYERS_PER_CURSOR_PAGE = 100
+MAX_BULK_PLAYERS = 5000
+EXPORT_BATCH_SIZE = 1000
 
 
-def paginate_players(request, selection):
-    page = request.args.get('page', 1, type=int)
+def paginate_players(request, query):
+    """Fetches only the requested page of query, a projection(Player) query,
+    from the database"""
+    page = max(request.args.get('page', 1, type=int), 1)
     start = (page - 1) * PLAYERS_PER_PAGE
-    end = start + PLAYERS_PER_PAGE
 
-    players = [player.format() for player in selection]
-    current_players = players[start:end]
+    selection = query.limit(PLAYERS_PER_PAGE).offset(start).all()
+    current_players = [format_row(Player, row) for row in selection]
 
     return current_players
 
 
+PLAYER_SORT_COLUMNS = {
+    'id': Player.id,
+    'name': Player.name,
+    'number': Player.number,
+    'position': Player.position,
+    'team_id': Player.team_id
+}
+
+
+def escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace(
+        '_', '\\_')
+
+
+def player_filters(request):
+    """Builds the WHERE criteria for the position, team_id, agent_id and name
+    (case insensitive prefix) query parameters"""
+    criteria = []
+
+    if 'position' in request.args:
+        criteria.append(Player.position == request.args['position'])
+
+    for key, column in (('team_id', Player.team_id),
+                        ('agent_id', Player.agent_id)):
+        if key in request.args:
+            value = request.args.get(key, type=int)
+            if value is None:
+                abort(400)
+            criteria.append(column == value)
+
+    if request.args.get('name'):
+        prefix = escape_like(request.args['name'].lower())
+        criteria.append(func.lower(Player.name).like(f'{prefix}%',
+                                                     escape='\\'))
+
+    return criteria
+
+
+def player_ordering(request):
+    """ORDER BY for the sort query parameter, a column name optionally
+    prefixed with - for descending. id breaks ties so pages are stable."""
+    sort = request.args.get('sort', 'id')
+    column = PLAYER_SORT_COLUMNS.get(sort.lstrip('-'))
+    if column is None:
+        abort(400)
+
+    if sort.startswith('-'):
+        return column.desc(), Player.id
+    return column.asc(), Player.id
+
+
+def encode_cursor(player_id):
+    return base64.urlsafe_b64encode(
+        str(player_id).encode('utf-8')).decode('utf-8').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Returns the last player id the cursor points past, 0 for an empty
+    cursor. Raises ValueError for anything encode_cursor didn't make."""
+    if not cursor:
+        return 0
+    padded = cursor + '=' * (-len(cursor) % 4)
+    return int(base64.urlsafe_b64decode(padded.encode('utf-8')).decode(
+        'utf-8'))
+
+
+def paginate_players_by_cursor(request, query):
+    """Keyset pagination, every page is an index range scan starting after
+    the cursor, so deep pages cost the same as the first one"""
+    try:
+        last_id = decode_cursor(request.args.get('cursor'))
+    except ValueError:
+        abort(400)
+
+    limit = request.args.get('limit', PLAYERS_PER_PAGE, type=int)
+    limit = min(max(limit, 1), MAX_PLAYERS_PER_CURSOR_PAGE)
+
+    # one extra row tells us whether there's a next page
+    selection = query.filter(Player.id > last_id).order_by(
+        Player.id).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(selection) > limit:
+        selection = selection[:limit]
+        next_cursor = encode_cursor(selection[-1].id)
+
+    return [format_row(Player, row) for row in selection], next_cursor
+
+
+def invalid_reference_response():
+    return jsonify({
+        'success': False,
+        'error': 400,
+        'message': 'The team_id or agent_id you entered does not exist in '
+                   'the database. Please check your input and try again.'
+    }), 400
+
+
+def locked_player_or_404(player_id):
+    """Loads the player with its row locked until the write commits, so
+    concurrent deletes and patches of the same player run one after the
+    other and each takes its payroll delta from the values the previous one
+    committed (a second delete finds no player and 404s)"""
+    return Player.query.filter_by(id=player_id).with_for_update() \
+        .populate_existing().first_or_404()
+
+
 @players_bp.route('/', methods=['GET'])
 def index():
     return jsonify({
@@ -31,28 +150,118 @@ def index():
 
 
 @players_bp.route('/players', methods=['GET'])
+@conditional('players')
+@cached('players')
 def get_all_players():
     try:
-        player_query = Player.query.all()
+        criteria = player_filters(request)
+
+        if 'cursor' in request.args:
+            # keyset pages only walk in id order
+            if request.args.get('sort', 'id') != 'id':
+                abort(400)
+
+            players, next_cursor = paginate_players_by_cursor(
+                request, Player.query.with_entities(
+                    *projection(Player)).filter(*criteria))
+
+            return jsonify({
+                'success': True,
+                'players': players,
+                'next_cursor': next_cursor
+            }), 200
+
+        total_players = count_rows(Player, *criteria)
 
-        if not player_query:
+        if not total_players:
             abort(404)
 
         paginated_players = paginate_players(
-            request, Player.query.order_by(Player.id).all())
+            request, Player.query.with_entities(
+                *projection(Player)).filter(*criteria).order_by(
+                *player_ordering(request)))
 
         return jsonify({
             'success': True,
             'players': paginated_players,
-            'total_players': len(player_query)
+            'total_players': total_players
         }), 200
 
     except Exception as error:
         raise error
 
 
+def export_players(request, extended=False):
+    """Streams every player matching the request's filters as NDJSON or CSV.
+    Rows are fetched through a server side cursor in batches, so memory use
+    doesn't grow with the table."""
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in ('ndjson', 'csv'):
+        abort(400)
+
+    criteria = player_filters(request)
+    fields = Player.extended_format_fields if extended else \
+        Player.format_fields
+    query = Player.query.with_entities(
+        *projection(Player, extended)).filter(*criteria).order_by(
+        Player.id).execution_options(stream_results=True).yield_per(
+        EXPORT_BATCH_SIZE)
+
+    def generate_ndjson():
+        batch = []
+        for row in query:
+            batch.append(json.dumps(dict(zip(fields, row))))
+            if len(batch) == EXPORT_BATCH_SIZE:
+                yield '\n'.join(batch) + '\n'
+                batch = []
+        if batch:
+            yield '\n'.join(batch) + '\n'
+
+    def generate_csv():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(fields)
+        for count, row in enumerate(query, 1):
+            writer.writerow(row)
+            if count % EXPORT_BATCH_SIZE == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    if export_format == 'csv':
+        generate, mimetype = generate_csv, 'text/csv'
+    else:
+        generate, mimetype = generate_ndjson, 'application/x-ndjson'
+
+    return Response(stream_with_context(generate()), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; '
+                             f'filename=players.{export_format}'})
+
+
+@players_bp.route('/players/export', methods=['GET'])
+def get_players_export():
+    try:
+        return export_players(request)
+
+    except Exception as error:
+        raise error
+
+
+@players_bp.route('/players/details/export', methods=['GET'])
+@requires_auth('get:player-details')
+def get_players_details_export(jwt):
+    try:
+        return export_players(request, extended=True)
+
+    except Exception as error:
+        raise error
+
+
 @players_bp.route('/players/<int:player_id>/details', methods=['GET'])
 @requires_auth('get:player-details')
+@conditional('players')
+@cached('player:{player_id}')
 def get_specific_player_details(jwt, player_id):
     try:
         player = Player.query.filter_by(id=player_id).first_or_404()
@@ -82,13 +291,83 @@ def post_player(jwt):
             'success': True,
             'new_player_id': new_player.id,
             'new_player': new_player.format_extended(),
-            'total_players': len(Player.query.all())
+            'total_players': count_rows(Player)
         }), 201
 
     except json.decoder.JSONDecodeError:
         abort(400)
     except TypeError:
         abort(400)
+    except IntegrityError:
+        # a team or agent deleted by another worker can still be in its id
+        # cache, the foreign key constraint catches it
+        db.session.rollback()
+        return invalid_reference_response()
+    except Exception as error:
+        raise error
+
+
+def bulk_player_errors(players):
+    """Per item errors for a bulk player body, checking every team_id and
+    agent_id with one lookup"""
+    player_keys = set(PLAYER_STRING_KEYS + PLAYER_INTEGER_KEYS +
+                      PLAYER_MONEY_KEYS)
+    errors = {}
+
+    for index, player in enumerate(players):
+        if not isinstance(player, dict) or set(player) - player_keys or \
+                not valid_player_fields(player):
+            errors[index] = 'All fields are required and cannot be empty.'
+
+    valid_players = [player for index, player in enumerate(players)
+                     if index not in errors]
+    team_ids, agent_ids = find_existing_ids(
+        {player['team_id'] for player in valid_players},
+        {player['agent_id'] for player in valid_players})
+
+    for index, player in enumerate(players):
+        if index not in errors and (player['team_id'] not in team_ids or
+                                    player['agent_id'] not in agent_ids):
+            errors[index] = 'The team_id or agent_id does not exist in the ' \
+                            'database.'
+
+    return [{'index': index, 'message': message}
+            for index, message in sorted(errors.items())]
+
+
+@players_bp.route('/players/bulk', methods=['POST'])
+@requires_auth('post:players')
+def post_players_bulk(jwt):
+    try:
+        body = json.loads(request.data)
+
+        if not isinstance(body, list) or not body or \
+                len(body) > MAX_BULK_PLAYERS:
+            abort(400)
+
+        errors = bulk_player_errors(body)
+        if errors:
+            return jsonify({
+                'success': False,
+                'error': 400,
+                'message': 'One or more players are invalid, no players '
+                           'were created.',
+                'errors': errors
+            }), 400
+
+        Player.insert_many(body)
+
+        return jsonify({
+            'success': True,
+            'total_created': len(body),
+            'total_players': count_rows(Player)
+        }), 201
+
+    except json.decoder.JSONDecodeError:
+        abort(400)
+    except IntegrityError:
+        db.session.rollback()
+        return invalid_reference_response()
     except Exception as error:
         raise error
 
@@ -97,14 +376,14 @@ def post_player(jwt):
 @requires_auth('delete:players')
 def delete_player(jwt, player_id):
     try:
-        player = Player.query.filter_by(id=player_id).first_or_404()
+        player = locked_player_or_404(player_id)
 
         player.delete()
 
         return jsonify({
             'success': True,
             'deleted_id': player.id,
-            'total_players': len(Player.query.all())
+            'total_players': count_rows(Player)
         }), 200
 
     except Exception as error:
@@ -115,11 +394,16 @@ def delete_player(jwt, player_id):
 @requires_auth('patch:players')
 def patch_player_details(jwt, player_id):
     try:
-        player = Player.query.filter_by(id=player_id).first_or_404()
+        player = locked_player_or_404(player_id)
 
         body = request.get_json()
 
-        if not valid_player_patch_body(body):
+        # the helper returns IntegrityError, rather than False, for a team_id
+        # or agent_id that doesn't exist
+        is_valid = valid_player_patch_body(body)
+        if is_valid is IntegrityError:
+            return invalid_reference_response()
+        if not is_valid:
             abort(400)
 
         for k, v in body.items():
@@ -135,12 +419,7 @@ def patch_player_details(jwt, player_id):
     except json.decoder.JSONDecodeError:
         abort(400)
     except IntegrityError:
-        return jsonify({
-            'success': False,
-            'error': 400,
-            'message': 'The team_id or agent_id you entered does not exist '
-                       'in the database. Please check your input and try '
-                       'again.'
-        }), 400
+        db.session.rollback()
+        return invalid_reference_response()
     except Exception as error:
         raise error
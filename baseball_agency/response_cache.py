@@ -0,0 +1,298 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+
+from collections import OrderedDict
+from functools import wraps
+from urllib.parse import urlencode
+
+from flask import current_app, g, make_response, request
+
+RESPONSE_CACHE = os.getenv('RESPONSE_CACHE', '')
+RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', 60))
+RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', 1024))
+RESPONSE_CACHE_STALE = int(os.getenv('RESPONSE_CACHE_STALE', 30))
+RESPONSE_COALESCE_TIMEOUT = float(os.getenv('RESPONSE_COALESCE_TIMEOUT', 10))
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBackend(object):
+    """Per process LRU of cached responses. Tag generations are kept apart
+    from the LRU, so evicting entries never resets a generation."""
+    def __init__(self, maxsize=RESPONSE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() >= entry[0]:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def generations(self, tags):
+        return [self._generations.get(tag, 0) for tag in tags]
+
+    def incr(self, tag):
+        with self._lock:
+            self._generations[tag] = self._generations.get(tag, 0) + 1
+
+
+class SharedBackend(object):
+    """Cache shared by every worker, on a redis-py compatible client (get,
+    set with ex, mget and incr), so an invalidation in one worker is seen by
+    all of them"""
+    def __init__(self, client, prefix='baseball-agency:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        return self.client.get(self.prefix + key)
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, value, ex=ttl)
+
+    def generations(self, tags):
+        return [int(generation or 0) for generation in self.client.mget(
+            [f'{self.prefix}generation:{tag}' for tag in tags])]
+
+    def incr(self, tag):
+        self.client.incr(f'{self.prefix}generation:{tag}')
+
+
+def backend_from_url(url):
+    """'' disables the cache, 'memory' is a per process LRU, and a redis://
+    url is shared by every worker (needs the redis package)"""
+    if not url:
+        return None
+    if url == 'memory':
+        return MemoryBackend()
+
+    try:
+        import redis
+    except ImportError:
+        raise RuntimeError('RESPONSE_CACHE needs the redis package for '
+                           f'{url}, pip install redis')
+    return SharedBackend(redis.Redis.from_url(url))
+
+
+class SingleFlight(object):
+    """Lets concurrent callers with the same key share one call
+
+    The first caller runs fn, callers arriving while it runs wait for it
+    and get its result instead of running fn again.
+    """
+    class Call(object):
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, wait=True, timeout=None):
+        """Returns (result, shared). shared callers get None if the call
+        raised, or without waiting (wait False) or after timeout seconds if
+        it hasn't finished."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self.Call()
+
+        if not leader:
+            if wait:
+                call.done.wait(timeout)
+            return call.result, True
+
+        try:
+            call.result = fn()
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+
+class ResponseCache(object):
+    """Serialized GET responses, invalidated by tag
+
+    Every entry is stored under its route and query string plus the current
+    generation of each of its tags, so invalidating a tag just increments
+    its generation and the old entries are never read again (they age out
+    of the backend). Backend errors are logged and treated as misses, so an
+    unreachable shared cache only costs the database queries.
+
+    Entries are fresh for ttl seconds and kept stale for another stale
+    seconds. A stale entry is refreshed by one request per worker while the
+    others keep serving it, so an expiring popular entry doesn't send every
+    client to the database at once.
+    """
+    def __init__(self, backend=None, ttl=RESPONSE_CACHE_TTL,
+                 stale=RESPONSE_CACHE_STALE):
+        self.backend = backend
+        self.ttl = ttl
+        self.stale = stale
+        self.flights = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.coalesced = 0
+
+    def key(self, route, tags):
+        generations = self.backend.generations(('*',) + tags)
+        versioned = ','.join(f'{tag}={generation}' for tag, generation
+                             in zip(('*',) + tags, generations))
+        return hashlib.sha256(
+            f'{route}|{versioned}'.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self.backend.set(key, value, self.ttl + self.stale)
+
+    def invalidate(self, *tags):
+        if self.backend is None:
+            return
+        for tag in tags:
+            try:
+                self.backend.incr(tag)
+            except Exception:
+                logger.exception(f'could not invalidate {tag}, cached '
+                                 f'responses may be stale for {self.ttl}s')
+
+    def clear(self):
+        self.invalidate('*')
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'stale_hits': self.stale_hits,
+            'coalesced': self.coalesced
+        }
+
+
+response_cache = ResponseCache(backend_from_url(RESPONSE_CACHE))
+
+
+def request_route():
+    """Path plus the query string in a canonical order"""
+    args = sorted(request.args.items(multi=True))
+    return f'{request.path}?{urlencode(args)}'
+
+
+def serialize(response, fresh_until):
+    etag = response.get_etag()[0] or '-'
+    header = (f'{response.status_code} {fresh_until} {etag} '
+              f'{response.mimetype}\n')
+    return header.encode('utf-8') + response.get_data()
+
+
+def deserialize(value):
+    """Returns the response, with the ETag it was stored with, and the
+    time.time() it's fresh until"""
+    header, body = value.split(b'\n', 1)
+    status, fresh_until, etag, mimetype = header.decode('utf-8').split(' ', 3)
+    response = current_app.response_class(body, status=int(status),
+                                          mimetype=mimetype)
+    if etag != '-':
+        response.set_etag(etag)
+    return response, float(fresh_until)
+
+
+def cached(*tags):
+    """Caches a GET view's 200 responses, per route and query string, until
+    one of tags is invalidated. Tags are formatted with the view's
+    arguments, e.g. 'roster:{team_id}'. Goes below requires_auth, so
+    permissions are checked on every request, and below conditional, whose
+    ETag (g.versions_etag) is stored with the entry and served with it: an
+    entry a write didn't invalidate goes out under the ETag of the versions
+    it was computed from, never a newer one, so clients don't get a 304 for
+    it once it's stale.
+
+    Identical requests arriving while one is being computed in the same
+    worker wait for it and share its response, whether or not a cache
+    backend is configured.
+    """
+    def cached_decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            backend = response_cache.backend
+            key = request_route()
+            value = None
+
+            if backend is not None:
+                entry_tags = tuple(tag.format(**kwargs) for tag in tags)
+                try:
+                    key = response_cache.key(key, entry_tags)
+                    value = response_cache.get(key)
+                except Exception:
+                    logger.exception('response cache lookup failed')
+
+            def compute():
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response, None
+
+                if g.get('versions_etag') is not None:
+                    response.set_etag(g.versions_etag)
+                value = serialize(response, time.time() + response_cache.ttl)
+                if backend is not None:
+                    try:
+                        response_cache.set(key, value)
+                    except Exception:
+                        logger.exception('response cache store failed')
+                return response, value
+
+            if value is not None:
+                response, fresh_until = deserialize(value)
+                if time.time() < fresh_until:
+                    return response
+
+                # stale: refresh it, unless a request in this worker
+                # already is, in which case keep serving it until then
+                result, shared = response_cache.flights.do(
+                    key, compute, wait=False)
+                if shared:
+                    response_cache.stale_hits += 1
+                    return response
+                return result[0]
+
+            result, shared = response_cache.flights.do(
+                key, compute, timeout=RESPONSE_COALESCE_TIMEOUT)
+            if not shared:
+                return result[0]
+
+            if result is not None and result[1] is not None:
+                response_cache.coalesced += 1
+                return deserialize(result[1])[0]
+
+            # the shared call failed, wasn't a 200, or is taking too long
+            return compute()[0]
+
+        return wrapper
+    return cached_decorator
@@ -2,7 +2,7 @@ def valid_team_body(body):
     is_valid = True
 
     expected_key = [
-        'name', 'abbr', 'city', 'state', 'total_payroll'
+        'name', 'abbr', 'city', 'state'
     ]
 
     try:
@@ -24,7 +24,7 @@ def valid_team_patch_body(body):
     is_valid = True
 
     possible_keys = [
-        'name', 'abbr', 'city', 'state', 'total_payroll'
+        'name', 'abbr', 'city', 'state'
     ]
 
     if body is None:
@@ -5,20 +5,25 @@ from sqlalchemy.exc import IntegrityError
 
 from auth.auth import requires_auth
 from baseball_agency.teams import teams_bp
+from ..conditional import conditional
+from ..response_cache import cached
 from .helpers import valid_team_body, valid_team_patch_body
-from ..models import Player, Team
+from ..models import db, Player, Team, count_rows, format_row, \
+    projection
 
 
 @teams_bp.route('/teams', methods=['GET'])
 @requires_auth('get:teams')
+@conditional('teams')
+@cached('teams')
 def get_all_teams(jwt):
     try:
-        team_query = Team.query.all()
+        team_query = Team.query.with_entities(*projection(Team)).all()
 
         if not team_query:
             abort(404)
 
-        all_teams = [team.format() for team in team_query]
+        all_teams = [format_row(Team, row) for row in team_query]
 
         return jsonify({
             'success': True,
@@ -32,6 +37,8 @@ def get_all_teams(jwt):
 
 @teams_bp.route('/teams/<int:team_id>/details', methods=['GET'])
 @requires_auth('get:team-details')
+@conditional('teams')
+@cached('team:{team_id}')
 def get_specific_team_details(jwt, team_id):
     try:
         team = Team.query.filter_by(id=team_id).first_or_404()
@@ -47,19 +54,28 @@ def get_specific_team_details(jwt, team_id):
 
 @teams_bp.route('/teams/<int:team_id>/roster', methods=['GET'])
 @requires_auth('get:team-roster')
+@conditional('teams', 'players')
+@cached('team:{team_id}', 'roster:{team_id}')
 def get_team_players(jwt, team_id):
     try:
-        team = Team.query.filter_by(id=team_id).first_or_404()
-
-        roster_query = Player.query.filter_by(team_id=team.id).all()
+        # one round trip: the outer join returns a single row with no player
+        # for a team without players, and no rows for a missing team
+        roster_query = db.session.query(
+            Team.name, *projection(Player)).outerjoin(
+            Player, Player.team_id == Team.id).filter(
+            Team.id == team_id).order_by(Player.id).all()
         if not roster_query:
             abort(404)
 
-        roster = [player.format() for player in roster_query]
+        team_name = roster_query[0][0]
+        roster = [format_row(Player, row[1:]) for row in roster_query
+                  if row.id is not None]
+        if not roster:
+            abort(404)
 
         return jsonify({
             'success': True,
-            'team': team.name,
+            'team': team_name,
             'roster': roster,
             'total_team_players': len(roster)
         }), 200
@@ -84,7 +100,7 @@ def post_team(jwt):
             'success': True,
             'new_team_id': new_team.id,
             'new_team': new_team.format_extended(),
-            'total_teams': len(Team.query.all())
+            'total_teams': count_rows(Team)
         }), 201
 
     except json.decoder.JSONDecodeError:
@@ -113,7 +129,7 @@ def delete_team(jwt, team_id):
         return jsonify({
             'success': True,
             'deleted_id': team.id,
-            'total_teams': len(Team.query.all())
+            'total_teams': count_rows(Team)
         }), 200
 
     except IntegrityError:
@@ -0,0 +1,70 @@
+"""Micro-benchmark for token signature verification
+
+Compares the old verify_decode_jwt path, which hands a raw JWK dict to
+jose.jwt.decode and lets it rebuild the RSA key on every call, with the
+PublicKey registry path, which parses the JWK once and only checks the
+signature per call.
+
+    python -m benchmarks.bench_auth [iterations]
+"""
+import json
+import sys
+import tempfile
+import timeit
+
+from jose import jwt
+
+from auth.jwks import PublicKey
+from auth.local_issuer import generate_signing_key, mint_token
+
+AUDIENCE = 'bench-audience'
+ISSUER = 'https://bench.invalid/'
+
+
+def make_token():
+    private_key_path, jwks_path = generate_signing_key(tempfile.mkdtemp(),
+                                                       kid='bench')
+    with open(jwks_path) as jwks_file:
+        public_jwk = json.load(jwks_file)['keys'][0]
+
+    token = mint_token(private_key_path, ['get:teams'], audience=AUDIENCE,
+                       issuer=ISSUER, kid='bench')
+
+    return token, public_jwk
+
+
+def decode_from_jwk_dict(token, public_jwk):
+    rsa_key = {
+        'kty': public_jwk['kty'],
+        'kid': public_jwk['kid'],
+        'use': public_jwk['use'],
+        'n': public_jwk['n'],
+        'e': public_jwk['e']
+    }
+    return jwt.decode(token, rsa_key, algorithms='RS256', audience=AUDIENCE,
+                      issuer=ISSUER)
+
+
+def decode_from_registry(token, registry):
+    key = registry['bench']
+    if not key.verify(token):
+        raise jwt.JWTError('Signature verification failed.')
+    return jwt.decode(token, key.verifier, algorithms='RS256',
+                      audience=AUDIENCE, issuer=ISSUER,
+                      options={'verify_signature': False})
+
+
+def main(iterations=2000):
+    token, public_jwk = make_token()
+    registry = {'bench': PublicKey(public_jwk)}
+
+    for name, func, arg in (
+            ('jwk dict', decode_from_jwk_dict, public_jwk),
+            ('registry', decode_from_registry, registry)):
+        seconds = timeit.timeit(lambda: func(token, arg), number=iterations)
+        print(f'{name:>10}: {seconds / iterations * 1e6:8.1f} us/token '
+              f'({iterations} iterations)')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
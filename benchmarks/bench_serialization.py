@@ -0,0 +1,68 @@
+"""Micro-benchmark for list serialization
+
+Compares loading full Player instances and calling format() on them, which
+is what the list endpoints used to do, with selecting only the formatted
+columns and building the dicts from the row tuples with format_row(). Runs
+against a throwaway sqlite database.
+
+    python -m benchmarks.bench_serialization [players] [iterations]
+"""
+import os
+import sys
+import tempfile
+import timeit
+
+from baseball_agency import create_app, db
+from baseball_agency.models import format_row, projection, Agent, Player, \
+    Team
+from config import Config
+
+
+class BenchConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(
+        tempfile.mkdtemp(), 'bench.db')
+
+
+def populate(players):
+    db.create_all()
+    db.session.add(Team(name='Bench Team', abbr='BEN', city='Bench City',
+                        state='Bench State'))
+    db.session.add(Agent(name='Bench Agent', salary='1 USD'))
+    db.session.flush()
+    db.session.add_all(
+        Player(name=f'Player {number}', number=str(number % 100),
+               position='Pitcher', salary='1 USD', team_id=1, agent_id=1)
+        for number in range(players))
+    db.session.commit()
+
+
+def format_instances():
+    result = [player.format() for player in Player.query.all()]
+    db.session.remove()
+    return result
+
+
+def format_projection():
+    result = [format_row(Player, row) for row in
+              Player.query.with_entities(*projection(Player)).all()]
+    db.session.remove()
+    return result
+
+
+def main(players=1000, iterations=50):
+    app = create_app(BenchConfig)
+    with app.app_context():
+        populate(players)
+        assert format_instances() == format_projection()
+
+        for name, func in (('instances', format_instances),
+                           ('projection', format_projection)):
+            seconds = timeit.timeit(func, number=iterations)
+            print(f'{name:>10}: '
+                  f'{seconds / iterations / players * 1e6:8.2f} us/row '
+                  f'({players} rows, {iterations} iterations)')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
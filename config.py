@@ -15,3 +15,6 @@ class Config(object):
     AUTH0_DOMAIN = os.environ.get('AUTH0_DOMAIN')
     AUTH0_CLIENT_ID = os.environ.get('AUTH0_CLIENT_ID')
     API_AUDIENCE = os.environ.get('API_AUDIENCE')
+    # number of proxies in front of the app (1 on Heroku), so that
+    # request.remote_addr is the client's address for auth throttling
+    PROXY_FIX_X_FOR = int(os.environ.get('PROXY_FIX_X_FOR', 0))
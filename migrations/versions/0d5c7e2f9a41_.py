@@ -0,0 +1,106 @@
+"""add integer cents columns for salaries and payroll
+
+Revision ID: 0d5c7e2f9a41
+Revises: 6b04a768b376
+Create Date: 2026-10-18 15:20:44.907163
+
+"""
+import re
+
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '0d5c7e2f9a41'
+down_revision = '6b04a768b376'
+branch_labels = None
+depends_on = None
+
+MONEY_COLUMNS = (
+    ('players', 'salary', 'salary_cents'),
+    ('agents', 'salary', 'salary_cents'),
+    ('teams', 'total_payroll', 'total_payroll_cents')
+)
+
+BACKFILL_BATCH_SIZE = 1000
+
+# a copy of baseball_agency.money.parse_money as of this revision, so the
+# backfill doesn't change if the app's parsing does
+MONEY_PATTERN = re.compile(
+    r'^\$?\s*(?P<amount>\d[\d,]*(?:\.\d+)?)\s*'
+    r'(?P<scale>thousand|million|billion|k|m|b)?\s*(?:usd)?$',
+    re.IGNORECASE)
+
+SCALES = {
+    '': 1,
+    'k': 10 ** 3,
+    'thousand': 10 ** 3,
+    'm': 10 ** 6,
+    'million': 10 ** 6,
+    'b': 10 ** 9,
+    'billion': 10 ** 9
+}
+
+
+def parse_cents(value):
+    match = MONEY_PATTERN.match((value or '').strip())
+    if match is None:
+        return None
+    try:
+        dollars = Decimal(match.group('amount').replace(',', '')) * \
+            SCALES[(match.group('scale') or '').lower()]
+    except InvalidOperation:
+        return None
+    return int((dollars * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def backfill(table, column, cents_column):
+    """Parses the strings into cents in primary key order, reading
+    BACKFILL_BATCH_SIZE rows at a time. Strings that don't parse are left
+    with NULL cents. Runs in whatever transaction mode the caller set up,
+    see upgrade()."""
+    bind = op.get_bind()
+    select = sa.text(f'SELECT id, {column} FROM {table} '
+                     f'WHERE id > :last AND {cents_column} IS NULL '
+                     f'ORDER BY id LIMIT :limit')
+    update = sa.text(f'UPDATE {table} SET {cents_column} = :cents '
+                     f'WHERE id = :id')
+
+    last = 0
+    while True:
+        rows = bind.execute(select, {'last': last,
+                                     'limit': BACKFILL_BATCH_SIZE}).fetchall()
+        if not rows:
+            return
+
+        parsed = [{'id': id, 'cents': parse_cents(value)}
+                  for id, value in rows]
+        parsed = [row for row in parsed if row['cents'] is not None]
+        if parsed:
+            bind.execute(update, parsed)
+        last = rows[-1][0]
+
+
+def upgrade():
+    for table, _, cents_column in MONEY_COLUMNS:
+        op.add_column(table, sa.Column(cents_column, sa.BigInteger(),
+                                       nullable=True))
+
+    if op.get_bind().dialect.name != 'postgresql':
+        for table, column, cents_column in MONEY_COLUMNS:
+            backfill(table, column, cents_column)
+        return
+
+    # outside the migration's transaction each row's UPDATE commits on its
+    # own, so a large table is never locked as a whole, and a backfill that
+    # stops part way resumes from the rows still missing their cents
+    with op.get_context().autocommit_block():
+        for table, column, cents_column in MONEY_COLUMNS:
+            backfill(table, column, cents_column)
+
+
+def downgrade():
+    for table, _, cents_column in reversed(MONEY_COLUMNS):
+        op.drop_column(table, cents_column)
@@ -0,0 +1,47 @@
+"""index players name for sorting
+
+Revision ID: 161c0987ecc4
+Revises: e1f6a0b9c254
+Create Date: 2026-10-18 21:14:36.602817
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '161c0987ecc4'
+down_revision = 'e1f6a0b9c254'
+branch_labels = None
+depends_on = None
+
+# ix_players_lower_name can't serve ORDER BY name, it's on lower(name) and on
+# postgres uses text_pattern_ops, which only orders by byte value
+NAME_INDEX = 'ix_players_name'
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        op.create_index(NAME_INDEX, 'players', ['name'], unique=False)
+        return
+
+    # built concurrently so writes to players aren't blocked, see
+    # bf14a8e7bcde
+    with op.get_context().autocommit_block():
+        invalid = op.get_bind().execute(sa.text(
+            'SELECT 1 FROM pg_index i JOIN pg_class c '
+            'ON c.oid = i.indexrelid '
+            'WHERE c.relname = :name AND NOT i.indisvalid'
+        ), {'name': NAME_INDEX}).scalar()
+        if invalid:
+            op.execute(f'DROP INDEX CONCURRENTLY {NAME_INDEX}')
+        op.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {NAME_INDEX} '
+                   f'ON players (name)')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        op.drop_index(NAME_INDEX, table_name='players')
+        return
+
+    with op.get_context().autocommit_block():
+        op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {NAME_INDEX}')
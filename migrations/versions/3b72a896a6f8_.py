@@ -0,0 +1,34 @@
+"""index players for filtering and sorting
+
+Revision ID: 3b72a896a6f8
+Revises: 872021e0161c
+Create Date: 2026-10-18 10:12:41.204113
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '3b72a896a6f8'
+down_revision = '872021e0161c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(op.f('ix_players_position'), 'players', ['position'],
+                    unique=False)
+
+    # text_pattern_ops lets postgres use the index for LIKE 'prefix%' under
+    # any collation
+    if op.get_bind().dialect.name == 'postgresql':
+        lower_name = sa.text('lower(name) text_pattern_ops')
+    else:
+        lower_name = sa.text('lower(name)')
+    op.create_index('ix_players_lower_name', 'players', [lower_name],
+                    unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_players_lower_name', table_name='players')
+    op.drop_index(op.f('ix_players_position'), table_name='players')
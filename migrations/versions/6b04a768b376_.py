@@ -0,0 +1,33 @@
+"""add table_versions for conditional GETs
+
+Revision ID: 6b04a768b376
+Revises: bf14a8e7bcde
+Create Date: 2026-10-18 13:41:05.118724
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '6b04a768b376'
+down_revision = 'bf14a8e7bcde'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    table_versions = op.create_table(
+        'table_versions',
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('name')
+    )
+    op.bulk_insert(table_versions, [
+        {'name': 'players', 'version': 0},
+        {'name': 'teams', 'version': 0},
+        {'name': 'agents', 'version': 0}
+    ])
+
+
+def downgrade():
+    op.drop_table('table_versions')
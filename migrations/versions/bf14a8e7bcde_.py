@@ -0,0 +1,53 @@
+"""index the players foreign keys concurrently
+
+Revision ID: bf14a8e7bcde
+Revises: 3b72a896a6f8
+Create Date: 2026-10-18 11:02:17.530291
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'bf14a8e7bcde'
+down_revision = '3b72a896a6f8'
+branch_labels = None
+depends_on = None
+
+FOREIGN_KEY_INDEXES = (
+    ('ix_players_team_id', 'team_id'),
+    ('ix_players_agent_id', 'agent_id')
+)
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        for name, column in FOREIGN_KEY_INDEXES:
+            op.create_index(name, 'players', [column], unique=False)
+        return
+
+    # CREATE INDEX CONCURRENTLY doesn't block writes to players, but can't run
+    # inside a transaction. A concurrent build that fails or is cancelled
+    # leaves an invalid index behind, which is dropped so a rerun rebuilds it.
+    with op.get_context().autocommit_block():
+        for name, column in FOREIGN_KEY_INDEXES:
+            invalid = op.get_bind().execute(sa.text(
+                'SELECT 1 FROM pg_index i JOIN pg_class c '
+                'ON c.oid = i.indexrelid '
+                'WHERE c.relname = :name AND NOT i.indisvalid'
+            ), {'name': name}).scalar()
+            if invalid:
+                op.execute(f'DROP INDEX CONCURRENTLY {name}')
+            op.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} '
+                       f'ON players ({column})')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        for name, _ in reversed(FOREIGN_KEY_INDEXES):
+            op.drop_index(name, table_name='players')
+        return
+
+    with op.get_context().autocommit_block():
+        for name, _ in reversed(FOREIGN_KEY_INDEXES):
+            op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
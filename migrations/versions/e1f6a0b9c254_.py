@@ -0,0 +1,59 @@
+"""derive teams.total_payroll_cents from the players' salaries
+
+Revision ID: e1f6a0b9c254
+Revises: 0d5c7e2f9a41
+Create Date: 2026-10-18 16:47:12.380519
+
+"""
+from decimal import Decimal
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'e1f6a0b9c254'
+down_revision = '0d5c7e2f9a41'
+branch_labels = None
+depends_on = None
+
+
+def format_money(cents):
+    # a copy of baseball_agency.money.format_money as of this revision
+    dollars = Decimal(cents) / 100
+    if dollars >= 10 ** 6:
+        return f'{(dollars / 10 ** 6).normalize():f} million USD'
+    if dollars == dollars.to_integral_value():
+        return f'{int(dollars):,} USD'
+    return f'{dollars:,.2f} USD'
+
+
+def upgrade():
+    # the hand set payrolls are replaced by the sum of the players' salaries,
+    # which the app keeps up to date from here on
+    op.execute('UPDATE teams SET total_payroll_cents = ('
+               'SELECT coalesce(sum(salary_cents), 0) FROM players '
+               'WHERE players.team_id = teams.id)')
+
+    with op.batch_alter_table('teams') as batch_op:
+        batch_op.alter_column('total_payroll_cents',
+                              existing_type=sa.BigInteger(), nullable=False,
+                              server_default='0')
+        batch_op.drop_column('total_payroll')
+
+
+def downgrade():
+    with op.batch_alter_table('teams') as batch_op:
+        batch_op.add_column(sa.Column('total_payroll', sa.String(),
+                                      nullable=True))
+        batch_op.alter_column('total_payroll_cents',
+                              existing_type=sa.BigInteger(), nullable=True,
+                              server_default=None)
+
+    bind = op.get_bind()
+    payrolls = bind.execute(sa.text(
+        'SELECT id, total_payroll_cents FROM teams')).fetchall()
+    if payrolls:
+        bind.execute(sa.text(
+            'UPDATE teams SET total_payroll = :total_payroll WHERE id = :id'),
+            [{'id': id, 'total_payroll': format_money(cents)}
+             for id, cents in payrolls])
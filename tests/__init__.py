@@ -1,3 +1,16 @@
+import os
+import tempfile
+
 from dotenv import load_dotenv
 
 load_dotenv()
+
+# the suite signs its own tokens (see test_data.py), so point auth at a
+# throwaway local signing key before anything imports auth.auth
+from auth.local_issuer import generate_signing_key  # noqa: E402
+
+os.environ.setdefault('AUTH0_DOMAIN', 'baseball-agency.auth0.com')
+os.environ.setdefault('API_AUDIENCE', 'baseball-agency-api')
+
+SIGNING_KEY_PATH, os.environ['JWKS_PATH'] = generate_signing_key(
+    tempfile.mkdtemp(prefix='baseball-agency-tests-'))
@@ -1,9 +1,22 @@
+import csv
 import json
 import os
+import tempfile
+import threading
+import time
 import unittest
 
+from contextlib import contextmanager
+from sqlalchemy import event
+
+from auth.auth import failure_limiter
 from baseball_agency import create_app, db
-from baseball_agency.models import db_drop_and_create_all, Player, Team, Agent
+from baseball_agency.id_cache import id_cache, IdCache
+from baseball_agency.money import format_money, money_value, parse_money
+from baseball_agency.response_cache import response_cache, MemoryBackend, \
+    SharedBackend, SingleFlight
+from baseball_agency.models import bump_versions, count_rows, \
+    db_drop_and_create_all, format_row, projection, Player, Team, Agent
 from config import Config
 from . import test_data
 
@@ -20,7 +33,9 @@ class BaseballTestCase(unittest.TestCase):
         self.app_context = self.app.app_context()
         self.app_context.push()
 
-        db.session.close()
+        # the scoped session outlives the app it was created for, remove it
+        # so this test's session (and engine) belong to this test's app
+        db.session.remove()
         db_drop_and_create_all()
 
         # create mock player, team, and agent to insert as needed
@@ -40,13 +55,41 @@ class BaseballTestCase(unittest.TestCase):
             name='Test Team',
             abbr='TTT',
             city='Test City',
-            state='Test State',
-            total_payroll='Test Salary USD'
+            state='Test State'
         )
 
     def tearDown(self):
         pass
 
+    @contextmanager
+    def count_queries(self):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute',
+                     before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, 'before_cursor_execute',
+                         before_cursor_execute)
+
+    def test_projection_matches_format(self):
+        self.mock_agent.insert()
+        self.mock_team.insert()
+        self.mock_player.insert()
+
+        for model, instance in ((Player, self.mock_player),
+                                (Team, self.mock_team),
+                                (Agent, self.mock_agent)):
+            for extended, expected in ((False, instance.format()),
+                                       (True, instance.format_extended())):
+                row = model.query.with_entities(
+                    *projection(model, extended)).one()
+                self.assertEqual(format_row(model, row, extended), expected)
+
     def test_get_index(self):
         response = self.client().get('/')
         data = json.loads(response.data)
@@ -56,6 +99,55 @@ class BaseballTestCase(unittest.TestCase):
         self.assertEqual(data['message'], 'Welcome to the FSND Baseball '
                                           'Agency API')
 
+    def test_auth_server_timing_header(self):
+        self.mock_team.insert()
+
+        response = self.client().get(
+            '/teams',
+            headers={'Authorization': f'Bearer {test_data.assistant_jwt}'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('auth-header;dur=', response.headers['Server-Timing'])
+        self.assertIn('auth-cache;dur=', response.headers['Server-Timing'])
+
+    def test_repeated_auth_failures_throttled(self):
+        self.mock_team.insert()
+        self.addCleanup(failure_limiter.clear)
+        self.client().get('/teams', headers={
+            'Authorization': f'Bearer {test_data.assistant_jwt}'})
+
+        for attempt in range(failure_limiter.limit):
+            response = self.client().get(
+                '/teams', headers={'Authorization': f'Bearer bad-{attempt}'})
+            self.assertEqual(response.status_code, 401)
+
+        response = self.client().get(
+            '/teams', headers={'Authorization': 'Bearer bad-again'})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['error'], 429)
+
+        # a token that already verified still gets through
+        response = self.client().get('/teams', headers={
+            'Authorization': f'Bearer {test_data.assistant_jwt}'})
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_get_metrics(self):
+        self.client().get(
+            '/teams',
+            headers={'Authorization': f'Bearer {test_data.assistant_jwt}'})
+
+        response = self.client().get('/metrics')
+        metrics = response.data.decode('utf-8')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('auth_phase_seconds_count{phase="header"}', metrics)
+        self.assertIn('auth_token_cache_hits_total', metrics)
+        self.assertIn('response_cache_coalesced_total', metrics)
+
     """
     Player Tests
     """
@@ -76,6 +168,240 @@ class BaseballTestCase(unittest.TestCase):
         self.assertTrue(data['players']),
         self.assertEqual(data['total_players'], 1)
 
+    def test_get_all_players_paginated(self):
+        self.mock_agent.insert()
+        self.mock_team.insert()
+
+        for number in range(15):
+            Player(name=f'Test Player {number}', number=str(number),
+                   position='Test Position', salary='Test Salary USD',
+                   team_id=1, agent_id=1).insert()
+
+        response = self.client().get('/players?page=2')
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['total_players'], 15)
+        self.assertEqual([player['name'] for player in data['players']],
+                         [f'Test Player {number}' for number in range(10, 15)])
+
+        response = self.client().get('/players?page=3')
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['players'], [])
+        self.assertEqual(data['total_players'], 15)
+
+    def test_get_all_players_cursor(self):
+        self.mock_agent.insert()
+        self.mock_team.insert()
+
+        for number in range(25):
+            Player(name=f'Test Player {number}', number=str(number),
+                   position='Test Position', salary='Test Salary USD',
+                   team_id=1, agent_id=1).insert()
+
+        names = []
+        cursor = ''
+        pages = 0
+        while cursor is not None:
+            response = self.client().get(f'/players?cursor={cursor}&limit=10')
+            data = json.loads(response.data)
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(data['success'], True)
+            names += [player['name'] for player in data['players']]
+            cursor = data['next_cursor']
+            pages += 1
+
+        self.assertEqual(pages, 3)
+        self.assertEqual(names, [f'Test Player {number}'
+                                 for number in range(25)])
+
+    def test_get_all_players_invalid_cursor(self):
+        response = self.client().get('/players?cursor=not-a-cursor')
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(data['success'], False)
+
+    def test_get_all_players_filtered_and_sorted(self):
+        self.mock_agent.insert()
+        self.mock_team.insert()
+        Team(name='Other Team', abbr='OTT', city='Other City',
+             state='Other State').insert()
+
+        for name, position, team_id in (('Alex Able', 'Pitcher', 1),
+                                        ('alan Baker', 'Pitcher', 2),
+                                        ('Al_ Catcher', 'Catcher', 1),
+                                        ('Bob Dale', 'Pitcher', 1)):
+            Player(name=name, number='1', position=position,
+                   salary='Test Salary USD', team_id=team_id,
+                   agent_id=1).insert()
+
+        response = self.client().get(
+            '/players?position=Pitcher&team_id=1&sort=-name')
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['total_players'], 2)
+        self.assertEqual([player['name'] for player in data['players']],
+                         ['Bob Dale', 'Alex Able'])
+
+        # name is a case insensitive prefix, LIKE wildcards are literal
+        response = self.client().get('/players?name=AL&sort=name')
+        data = json.loads(response.data)
+
+        self.assertEqual([player['name'] for player in data['players']],
+                         ['Al_ Catcher', 'Alex Able', 'alan Baker'])
+
+        response = self.client().get('/players?name=al_')
+        data = json.loads(response.data)
+
+        self.assertEqual([player['name'] for player in data['players']],
+                         ['Al_ Catcher'])
+
+        response = self.client().get('/players?agent_id=1&cursor=&limit=2')
+        data = json.loads(response.data)
+
+        self.assertEqual(len(data['players']), 2)
+        self.assertTrue(data['next_cursor'])
+
+    def test_get_all_players_invalid_filters(self):
+        self.mock_agent.insert()
+        self.mock_team.insert()
+        self.mock_player.insert()
+
+        for query in ('sort=salary', 'team_id=one', 'cursor=&sort=name'):
+            response = self.client().get(f'/players?{query}')
+            data = json.loads(response.data)
+
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(data['success'], False)
+
+    def test_get_players_export_ndjson(self):
+        self.mock_agent.insert()
+        self.mock_team.insert()
+        Player.insert_many(self.bulk_players(2500))
+
+        response = self.client().get('/players/export?position=Pitcher',
+                                     buffered=False)
+        # sent in batches rather than built up front
+        chunks = list(response.response)
+        response.close()
+        players = [json.loads(line) for line in
+                   b''.join(chunks).decode('utf-8').splitlines()]
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        self.assertEqual(len(players), 2500)
+        self.assertEqual(players[0],
+                         Player.query.filter_by(id=1).one().format())
+        self.assertEqual([player['id'] for player in players],
+                         list(range(1, 2501)))
+
+    def test_get_players_export_csv(self):
+        self.mock_agent.insert()
+        self.mock_team.insert()
+        Player.insert_many(self.bulk_players(1500))
+
+        response = self.client().get('/players/export?format=csv')
+        rows = list(csv.reader(response.get_data(as_text=True).splitlines()))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/csv')
+        self.assertEqual(rows[0], list(Player.format_fields))
+        self.assertEqual(len(rows), 1501)
+        self.assertEqual(rows[1], ['1', 'Bulk Player 0', '0', 'Pitcher',
+                                   '1'])
+
+    def test_get_players_export_invalid_format(self):
+        response = self.client().get('/players/export?format=xml')
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(data['success'], False)
+
+    def test_get_players_details_export(self):
+        self.mock_agent.insert()
+        self.mock_team.insert()
+        self.mock_player.insert()
+
+        response = self.client().get('/players/details/export')
+        self.assertEqual(response.status_code, 401)
+
+        response = self.client().get(
+            '/players/details/export',
+            headers={'Authorization': f'Bearer {test_data.assistant_jwt}'})
+        players = [json.loads(line) for line in
+                   response.get_data(as_text=True).splitlines()]
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(players, [self.mock_player.format_extended()])
+
+    def test_get_all_players_not_modified(self):
+        self.mock_agent.insert()
+        self.mock_team.insert()
+        self.mock_player.insert()
+
+        response = self.client().get('/players')
+        etag = response.headers['ETag']
+
+        self.assertEqual(response.status_code, 200)
+
+        with self.count_queries() as statements:
+            response = self.client().get(
+                '/players', headers={'If-None-Match': etag})
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+        self.assertEqual(response.headers['ETag'], etag)
+        # only the version lookup, the view never ran
+        self.assertEqual(len(statements), 1)
+        self.assertIn('table_versions', statements[0])
+
+        Player(name='Second Player', number='01', position='Test Position',
+               salary='Test Salary USD', team_id=1, agent_id=1).insert()
+
+        response = self.client().get(
+            '/players', headers={'If-None-Match': etag})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        self.assertEqual(data['total_players'], 2)
+
+    def test_get_team_players_not_modified(self):
+        self.mock_agent.insert()
+        self.mock_team.insert()
+        self.mock_player.insert()
+        headers = {'Authorization': f'Bearer {test_data.agent_jwt}'}
+
+        etag = self.client().get('/teams/1/roster',
+                                 headers=headers).headers['ETag']
+
+        response = self.client().get(
+            '/teams/1/roster', headers={**headers, 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        # renaming the team changes the roster response too
+        self.mock_team.name = 'Renamed Team'
+        self.mock_team.update()
+
+        response = self.client().get(
+            '/teams/1/roster', headers={**headers, 'If-None-Match': etag})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['team'], 'Renamed Team')
+
+        # no 304 without a valid token
+        response = self.client().get(
+            '/teams/1/roster',
+            headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(response.status_code, 401)
+
     def test_get_all_players_empty_database(self):
         response = self.client().get('/players')
         data = json.loads(response.data)
@@ -257,6 +583,234 @@ class BaseballTestCase(unittest.TestCase):
         self.assertTrue(data['new_player_id'])
         self.assertTrue(data['total_players'])
 
+    def test_post_player_numeric_salary(self):
+        self.mock_agent.insert()
+        self.mock_team.insert()
+
+        response = self.client().post(
+            '/players',
+            json={
+                'name': 'New Test Player',
+                'number': '99',
+                'position': 'New Test Position',
+                'salary': 583500,
+                'team_id': 1,
+                'agent_id': 1
+            },
+            headers={'Authorization': f'Bearer {test_data.agent_jwt}'})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(data['new_player']['salary'], '583,500 USD')
+
+        response = self.client().get(
+            f'/players/{data["new_player_id"]}/details',
+            headers={'Authorization': f'Bearer {test_data.agent_jwt}'})
+        data = json.loads(response.data)
+
+        self.assertEqual(data['player_details']['salary_cents'], 58350000)
+
+    def test_post_player_negative_salary(self):
+        self.mock_agent.insert()
+        self.mock_team.insert()
+
+        response = self.client().post(
+            '/players',
+            json={
+                'name': 'New Test Player',
+                'number': '99',
+                'position': 'New Test Position',
+                'salary': -1,
+                'team_id': 1,
+                'agent_id': 1
+            },
+            headers={'Authorization': f'Bearer {test_data.agent_jwt}'})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(data['success'], False)
+
+    def post_mock_player(self):
+        return self.client().post(
+            '/players',
+            json={
+                'name': 'New Test Player',
+                'number': '99',
+                'position': 'New Test Position',
+                'salary': 'New Test Salary',
+                'team_id': 1,
+                'agent_id': 1
+            },
+            headers={'Authorization': f'Bearer {test_data.agent_jwt}'})
+
+    def test_post_player_checks_ids_in_one_query(self):
+        self.mock_agent.insert()
+        self.mock_team.insert()
+
+        with self.count_queries() as statements:
+            response = self.post_mock_player()
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len([statement for statement in statements
+                              if 'EXISTS' in statement]), 1)
+
+    def test_post_player_id_cache(self):
+        self.addCleanup(setattr, id_cache, 'ttl', id_cache.ttl)
+        self.addCleanup(id_cache.clear)
+        id_cache.ttl = 60
+
+        # inserting the team and agent caches their ids
+        self.mock_agent.insert()
+        self.mock_team.insert()
+
+        with self.count_queries() as statements:
+            response = self.post_mock_player()
+
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse([statement for statement in statements
+                          if 'EXISTS' in statement])
+
+        Team(name='Other Team', abbr='OTT', city='Other City',
+             state='Other State').insert()
+        self.assertIn(('teams', 2), id_cache)
+
+        Team.query.filter_by(id=2).one().delete()
+        self.assertNotIn(('teams', 2), id_cache)
+
+    def test_patch_player_id_cache_rejects_unhashable_ids(self):
+        self.addCleanup(setattr, id_cache, 'ttl', id_cache.ttl)
+        self.addCleanup(id_cache.clear)
+        id_cache.ttl = 60
+
+        self.mock_agent.insert()
+        self.mock_team.insert()
+        self.mock_player.insert()
+
+        for body in ({'team_id': [1]}, {'agent_id': {'id': 1}}):
+            response = self.client().patch(
+                f'/players/{self.mock_player.id}', json=body,
+                headers={'Authorization': f'Bearer {test_data.agent_jwt}'})
+
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(json.loads(response.data)['success'], False)
+
+    def enforce_foreign_keys(self):
+        """sqlite only checks foreign keys when asked to, per connection"""
+        engine = db.session.get_bind()
+        if engine.dialect.name != 'sqlite':
+            return
+
+        def connect(dbapi_connection, connection_record):
+            dbapi_connection.execute('PRAGMA foreign_keys = ON')
+
+        event.listen(engine, 'connect', connect)
+        self.addCleanup(engine.dispose)
+        self.addCleanup(event.remove, engine, 'connect', connect)
+        db.session.close()
+        engine.dispose()
+
+    def test_post_player_team_deleted_by_another_worker(self):
+        self.addCleanup(setattr, id_cache, 'ttl', id_cache.ttl)
+        self.addCleanup(id_cache.clear)
+        id_cache.ttl = 60
+        self.enforce_foreign_keys()
+
+        self.mock_agent.insert()
+        self.mock_team.insert()
+        # deleted without going through this worker's id cache
+        db.session.execute(db.text('DELETE FROM teams WHERE id = 1'))
+        db.session.commit()
+        self.assertIn(('teams', 1), id_cache)
+
+        response = self.post_mock_player()
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(data['message'], 'The team_id or agent_id you '
+                                          'entered does not exist in the '
+                                          'database. Please check your input '
+                                          'and try again.')
+
+        response = self.client().post(
+            '/players/bulk', json=self.bulk_players(2),
+            headers={'Authorization': f'Bearer {test_data.agent_jwt}'})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.data)['message'],
+                         data['message'])
+        self.assertEqual(count_rows(Player), 0)
+
+    def bulk_players(self, count):
+        return [{
+            'name': f'Bulk Player {number}',
+            'number': str(number),
+            'position': 'Pitcher',
+            'salary': 'Test Salary USD',
+            'team_id': 1,
+            'agent_id': 1
+        } for number in range(count)]
+
+    def test_post_players_bulk(self):
+        self.mock_agent.insert()
+        self.mock_team.insert()
+
+        with self.count_queries() as statements:
+            response = self.client().post(
+                '/players/bulk',
+                json=self.bulk_players(500),
+                headers={'Authorization': f'Bearer {test_data.agent_jwt}'})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['total_created'], 500)
+        self.assertEqual(data['total_players'], 500)
+        # id lookup, executemany insert, count
+        self.assertEqual(len([statement for statement in statements
+                              if statement.lstrip().startswith(
+                                  ('SELECT', 'INSERT'))]), 3)
+
+    def test_post_players_bulk_invalid_items(self):
+        self.mock_agent.insert()
+        self.mock_team.insert()
+
+        players = self.bulk_players(4)
+        players[1]['name'] = ''
+        players[2]['team_id'] = 9000
+        players[3] = 'not a player'
+
+        response = self.client().post(
+            '/players/bulk',
+            json=players,
+            headers={'Authorization': f'Bearer {test_data.agent_jwt}'})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(data['success'], False)
+        self.assertEqual([error['index'] for error in data['errors']],
+                         [1, 2, 3])
+        self.assertIn('team_id', data['errors'][1]['message'])
+        self.assertEqual(Player.query.count(), 0)
+
+    def test_post_players_bulk_not_a_list(self):
+        for body in ({'name': 'Bulk Player'}, []):
+            response = self.client().post(
+                '/players/bulk',
+                json=body,
+                headers={'Authorization': f'Bearer {test_data.agent_jwt}'})
+            data = json.loads(response.data)
+
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(data['success'], False)
+
+    def test_post_players_bulk_assistant_token(self):
+        response = self.client().post(
+            '/players/bulk',
+            json=self.bulk_players(1),
+            headers={'Authorization': f'Bearer {test_data.assistant_jwt}'})
+
+        self.assertEqual(response.status_code, 403)
+
     def test_post_player_executive_token(self):
         # posting a player requires pre-existing team and agent in db
         self.mock_agent.insert()
@@ -781,6 +1335,26 @@ class BaseballTestCase(unittest.TestCase):
         self.assertEqual(data['updated_player']['salary'], test_edit_body[
             'salary'])
 
+    def test_patch_player_salary_updates_cents(self):
+        self.mock_agent.insert()
+        self.mock_team.insert()
+        self.mock_player.insert()
+
+        self.assertIsNone(self.mock_player.salary_cents)
+
+        response = self.client().patch(
+            f'/players/{self.mock_player.id}',
+            json={'salary': 1500000},
+            headers={'Authorization': f'Bearer {test_data.agent_jwt}'})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['updated_player']['salary'],
+                         '1.5 million USD')
+        self.assertEqual(
+            Player.query.filter_by(id=self.mock_player.id).one().salary_cents,
+            150000000)
+
     def test_patch_player_executive_token(self):
         # posting a player requires pre-existing team and agent in db
         self.mock_agent.insert()
@@ -1105,8 +1679,7 @@ class BaseballTestCase(unittest.TestCase):
         self.assertEqual(data['team_details']['abbr'], 'TTT')
         self.assertEqual(data['team_details']['city'], 'Test City')
         self.assertEqual(data['team_details']['state'], 'Test State')
-        self.assertEqual(data['team_details']['total_payroll'],
-                         'Test Salary USD')
+        self.assertEqual(data['team_details']['total_payroll'], '0 USD')
 
     def test_get_team_details_by_id_executive_token(self):
         # insert mock team because db initializes empty
@@ -1126,8 +1699,111 @@ class BaseballTestCase(unittest.TestCase):
         self.assertEqual(data['team_details']['abbr'], 'TTT')
         self.assertEqual(data['team_details']['city'], 'Test City')
         self.assertEqual(data['team_details']['state'], 'Test State')
-        self.assertEqual(data['team_details']['total_payroll'],
-                         'Test Salary USD')
+        self.assertEqual(data['team_details']['total_payroll'], '0 USD')
+
+    def team_payroll(self, team_id):
+        return db.session.query(Team.total_payroll_cents).filter(
+            Team.id == team_id).scalar()
+
+    def test_team_payroll_follows_player_writes(self):
+        self.mock_agent.insert()
+        self.mock_team.insert()
+        Team(name='Other Team', abbr='OTT', city='Other City',
+             state='Other State').insert()
+        headers = {'Authorization': f'Bearer {test_data.agent_jwt}'}
+
+        player_id = json.loads(self.client().post('/players', json={
+            'name': 'New Test Player',
+            'number': '99',
+            'position': 'New Test Position',
+            'salary': '1 million USD',
+            'team_id': 1,
+            'agent_id': 1
+        }, headers=headers).data)['new_player_id']
+        self.assertEqual(self.team_payroll(1), 100000000)
+
+        self.client().patch(f'/players/{player_id}', json={'salary': 2500000},
+                            headers=headers)
+        self.assertEqual(self.team_payroll(1), 250000000)
+
+        # a transfer moves the salary, a salary change on the way applies
+        self.client().patch(f'/players/{player_id}',
+                            json={'team_id': 2, 'salary': '3 million USD'},
+                            headers=headers)
+        self.assertEqual(self.team_payroll(1), 0)
+        self.assertEqual(self.team_payroll(2), 300000000)
+
+        self.client().delete(f'/players/{player_id}', headers=headers)
+        self.assertEqual(self.team_payroll(2), 0)
+
+    def test_team_payroll_updates_are_increments(self):
+        self.mock_agent.insert()
+        self.mock_team.insert()
+        self.mock_player.insert()
+
+        with self.count_queries() as statements:
+            self.client().patch(
+                f'/players/{self.mock_player.id}', json={'salary': 1000},
+                headers={'Authorization': f'Bearer {test_data.agent_jwt}'})
+
+        self.assertEqual(len([statement for statement in statements
+                              if statement.startswith('UPDATE teams')]), 1)
+        self.assertFalse([statement for statement in statements
+                          if statement.startswith('SELECT') and
+                          'sum(' in statement])
+        self.assertEqual(self.team_payroll(1), 100000)
+
+    def test_delete_and_patch_lock_the_player_row(self):
+        if db.session.get_bind().dialect.name != 'postgresql':
+            self.skipTest('sqlite has no row locks')
+
+        self.mock_agent.insert()
+        self.mock_team.insert()
+        self.mock_player.insert()
+        headers = {'Authorization': f'Bearer {test_data.agent_jwt}'}
+
+        with self.count_queries() as statements:
+            self.client().patch(f'/players/{self.mock_player.id}',
+                                json={'salary': 1000}, headers=headers)
+            self.client().delete(f'/players/{self.mock_player.id}',
+                                 headers=headers)
+
+        self.assertEqual(len([statement for statement in statements
+                              if 'FROM players' in statement and
+                              'FOR UPDATE' in statement]), 2)
+        self.assertEqual(self.team_payroll(1), 0)
+
+    def test_team_payroll_after_bulk_insert(self):
+        self.mock_agent.insert()
+        self.mock_team.insert()
+        players = self.bulk_players(3)
+        for player in players:
+            player['salary'] = 1000
+
+        response = self.client().post(
+            '/players/bulk', json=players,
+            headers={'Authorization': f'Bearer {test_data.agent_jwt}'})
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.team_payroll(1), 300000)
+
+    def test_get_team_details_does_not_read_players(self):
+        self.mock_agent.insert()
+        self.mock_team.insert()
+        self.mock_player.salary = 583500
+        self.mock_player.insert()
+
+        with self.count_queries() as statements:
+            response = self.client().get(
+                '/teams/1/details',
+                headers={'Authorization': f'Bearer {test_data.agent_jwt}'})
+        data = json.loads(response.data)
+
+        self.assertEqual(data['team_details']['total_payroll'], '583,500 USD')
+        self.assertEqual(data['team_details']['total_payroll_cents'],
+                         58350000)
+        self.assertFalse([statement for statement in statements
+                          if 'players' in statement])
 
     def test_get_team_by_id_not_exist(self):
         # uses agent token, previous test already verified the token is valid
@@ -1225,6 +1901,28 @@ class BaseballTestCase(unittest.TestCase):
         self.assertTrue(data['roster'])
         self.assertEqual(data['total_team_players'], 1)
 
+    def test_get_team_players_single_query(self):
+        self.mock_agent.insert()
+        self.mock_team.insert()
+        self.mock_player.insert()
+        Player(name='Second Player', number='01', position='Test Position',
+               salary='Test Salary USD', team_id=1, agent_id=1).insert()
+        db.session.close()
+
+        with self.count_queries() as statements:
+            response = self.client().get(
+                '/teams/1/roster',
+                headers={'Authorization': f'Bearer {test_data.agent_jwt}'})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['team'], 'Test Team')
+        self.assertEqual([player['name'] for player in data['roster']],
+                         ['Test Player', 'Second Player'])
+        # plus the table_versions lookup for the ETag
+        self.assertEqual(len([statement for statement in statements
+                              if 'table_versions' not in statement]), 1)
+
     def test_get_team_players_empty_roster(self):
         # uses agent token, previous test already verified the token is valid
         # insert mock team because db initializes empty
@@ -1260,8 +1958,7 @@ class BaseballTestCase(unittest.TestCase):
             'name': 'New Test Team',
             'abbr': 'TEST',
             'city': 'New Test City',
-            'state': 'New Test State',
-            'total_payroll': '1 million USD'
+            'state': 'New Test State'
         }
 
         response = self.client().post(
@@ -1278,8 +1975,7 @@ class BaseballTestCase(unittest.TestCase):
             'name': 'New Test Team',
             'abbr': 'TEST',
             'city': 'New Test City',
-            'state': 'New Test State',
-            'total_payroll': '1 million USD'
+            'state': 'New Test State'
         }
 
         response = self.client().post(
@@ -1297,8 +1993,7 @@ class BaseballTestCase(unittest.TestCase):
             'name': 'New Test Team',
             'abbr': 'TEST',
             'city': 'New Test City',
-            'state': 'New Test State',
-            'total_payroll': '1 million USD'
+            'state': 'New Test State'
         }
 
         response = self.client().post(
@@ -1317,8 +2012,7 @@ class BaseballTestCase(unittest.TestCase):
                          mock_team['city'])
         self.assertEqual(data['new_team']['state'],
                          mock_team['state'])
-        self.assertEqual(data['new_team']['total_payroll'],
-                         mock_team['total_payroll'])
+        self.assertEqual(data['new_team']['total_payroll'], '0 USD')
         self.assertTrue(data['new_team_id'])
         self.assertTrue(data['total_teams'])
 
@@ -1328,8 +2022,7 @@ class BaseballTestCase(unittest.TestCase):
             'name': 'New Test Team',
             'abbr': 'TEST',
             'city': 'New Test City',
-            'state': 'New Test State',
-            'total_payroll': '1 million USD'
+            'state': 'New Test State'
         }
 
         response = self.client().post(
@@ -1453,14 +2146,14 @@ class BaseballTestCase(unittest.TestCase):
                                           'request that this server could '
                                           'not understand.')
 
-    def test_post_team_invalid_body_missing_total_payroll(self):
-        # uses agent token, previous test already verified the token is valid
-        # mock team to test post_team view
+    def test_post_team_invalid_body_total_payroll(self):
+        # total_payroll is computed from the players, it can't be set
         mock_team = {
             'name': 'New Test Team',
             'abbr': 'TEST',
             'city': 'New Test City',
-            'state': 'New Test State'
+            'state': 'New Test State',
+            'total_payroll': '1 million USD'
         }
 
         response = self.client().post(
@@ -1574,8 +2267,7 @@ class BaseballTestCase(unittest.TestCase):
             'name': 'After Team Edit',
             'abbr': 'EDIT',
             'city': 'AfterEdit City',
-            'state': 'AfterEdit State',
-            'total_payroll': 'AfterEdit USD'
+            'state': 'AfterEdit State'
         }
 
         response = self.client().patch(
@@ -1595,8 +2287,7 @@ class BaseballTestCase(unittest.TestCase):
             'name': 'After Team Edit',
             'abbr': 'EDIT',
             'city': 'AfterEdit City',
-            'state': 'AfterEdit State',
-            'total_payroll': 'AfterEdit USD'
+            'state': 'AfterEdit State'
         }
 
         response = self.client().patch(
@@ -1617,8 +2308,7 @@ class BaseballTestCase(unittest.TestCase):
             'name': 'After Team Edit',
             'abbr': 'EDIT',
             'city': 'AfterEdit City',
-            'state': 'AfterEdit State',
-            'total_payroll': 'AfterEdit USD'
+            'state': 'AfterEdit State'
         }
 
         response = self.client().patch(
@@ -1638,8 +2328,7 @@ class BaseballTestCase(unittest.TestCase):
             'city'])
         self.assertEqual(data['updated_team']['state'], test_edit_body[
             'state'])
-        self.assertEqual(data['updated_team']['total_payroll'],
-                         test_edit_body['total_payroll'])
+        self.assertEqual(data['updated_team']['total_payroll'], '0 USD')
 
     def test_patch_team_executive_token(self):
         # insert mock team because db initializes empty
@@ -1650,8 +2339,7 @@ class BaseballTestCase(unittest.TestCase):
             'name': 'After Team Edit',
             'abbr': 'EDIT',
             'city': 'AfterEdit City',
-            'state': 'AfterEdit State',
-            'total_payroll': 'AfterEdit USD'
+            'state': 'AfterEdit State'
         }
 
         response = self.client().patch(
@@ -2066,6 +2754,26 @@ class BaseballTestCase(unittest.TestCase):
                                           'URL manually please check your '
                                           'spelling and try again.')
 
+    def test_get_agent_clients_single_query(self):
+        self.mock_agent.insert()
+        self.mock_team.insert()
+        self.mock_player.insert()
+        db.session.close()
+
+        with self.count_queries() as statements:
+            response = self.client().get(
+                '/agents/1/clients',
+                headers={'Authorization':
+                         f'Bearer {test_data.executive_jwt}'})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['agent'], 'Test Agent')
+        self.assertEqual(data['total_agent_clients'], 1)
+        # plus the table_versions lookup for the ETag
+        self.assertEqual(len([statement for statement in statements
+                              if 'table_versions' not in statement]), 1)
+
     def test_get_agent_clients_empty_clients(self):
         # uses executive token, previous test already verified the token is
         # valid
@@ -2475,6 +3183,729 @@ class BaseballTestCase(unittest.TestCase):
                                           'request that this server could '
                                           'not understand.')
 
+    """
+    League Tests
+    """
+
+    def test_get_league_summary_no_token(self):
+        response = self.client().get('/league/summary')
+
+        self.assertEqual(response.status_code, 401)
+
+    def test_get_league_summary_agent_token(self):
+        # agents can see payrolls but not other agents' clients
+        response = self.client().get(
+            '/league/summary',
+            headers={'Authorization': f'Bearer {test_data.agent_jwt}'})
+
+        self.assertEqual(response.status_code, 403)
+
+    def test_get_league_summary_executive_token(self):
+        self.mock_agent.insert()
+        self.mock_team.insert()
+        Team(name='Other Team', abbr='OTT', city='Other City',
+             state='Other State').insert()
+        Player.insert_many([
+            {'name': 'Test Player', 'number': str(number),
+             'position': position, 'salary': 583500, 'team_id': 1,
+             'agent_id': 1}
+            for number, position in enumerate(('Pitcher', 'Pitcher',
+                                               'Catcher'))])
+
+        with self.count_queries() as statements:
+            response = self.client().get(
+                '/league/summary',
+                headers={'Authorization': f'Bearer {test_data.executive_jwt}'})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['teams'], [
+            {'id': 1, 'name': 'Test Team', 'abbr': 'TTT', 'total_players': 3,
+             'total_payroll': '1.7505 million USD',
+             'total_payroll_cents': 175050000},
+            {'id': 2, 'name': 'Other Team', 'abbr': 'OTT', 'total_players': 0,
+             'total_payroll': '0 USD', 'total_payroll_cents': 0}])
+        self.assertEqual(data['agents'], [
+            {'id': 1, 'name': 'Test Agent', 'total_clients': 3}])
+        self.assertEqual(data['positions'], [
+            {'position': 'Pitcher', 'total_players': 2},
+            {'position': 'Catcher', 'total_players': 1}])
+        self.assertEqual(data['total_teams'], 2)
+        self.assertEqual(data['total_agents'], 1)
+        self.assertEqual(data['total_players'], 3)
+        self.assertEqual(data['total_payroll_cents'], 175050000)
+
+        # three GROUP BY queries besides the ETag's version lookup
+        queries = [statement for statement in statements
+                   if 'table_versions' not in statement]
+        self.assertEqual(len(queries), 3)
+        self.assertTrue(all('GROUP BY' in query for query in queries))
+
+    def test_get_league_summary_empty(self):
+        response = self.client().get(
+            '/league/summary',
+            headers={'Authorization': f'Bearer {test_data.executive_jwt}'})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['teams'], [])
+        self.assertEqual(data['total_players'], 0)
+        self.assertEqual(data['total_payroll'], '0 USD')
+
+
+class PlayerIndexTestCase(unittest.TestCase):
+    """Checks the query plans for the players foreign key lookups use the
+    indexes, and fall back to a full scan without them"""
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        db.session.remove()
+        db_drop_and_create_all()
+
+    def tearDown(self):
+        db.session.close()
+        self.app_context.pop()
+
+    def explain(self, query):
+        dialect = db.engine.dialect
+        sql = str(query.statement.compile(
+            dialect=dialect, compile_kwargs={'literal_binds': True}))
+
+        if dialect.name == 'postgresql':
+            # the test tables are tiny, so without this the planner would
+            # pick a sequential scan even when an index is usable
+            db.session.execute(db.text('SET LOCAL enable_seqscan = off'))
+            rows = db.session.execute(db.text(f'EXPLAIN {sql}'))
+        else:
+            rows = db.session.execute(db.text(f'EXPLAIN QUERY PLAN {sql}'))
+
+        plan = ' '.join(str(column) for row in rows for column in row)
+        db.session.rollback()
+        return plan
+
+    def change_schema(self, ddl):
+        db.session.close()
+        ddl(db.engine)
+        # sqlite connections cache prepared EXPLAIN statements, which aren't
+        # re-planned when the schema changes
+        db.engine.dispose()
+
+    def test_foreign_key_lookups_use_indexes(self):
+        indexes = {index.name: index for index in Player.__table__.indexes}
+
+        for column, name in (('team_id', 'ix_players_team_id'),
+                             ('agent_id', 'ix_players_agent_id')):
+            query = Player.query.filter_by(**{column: 1})
+            index = indexes[name]
+
+            self.assertIn(name, self.explain(query))
+
+            self.change_schema(index.drop)
+            try:
+                self.assertNotIn(name, self.explain(query))
+            finally:
+                self.change_schema(index.create)
+
+            self.assertIn(name, self.explain(query))
+
+    def test_name_sort_uses_index(self):
+        query = Player.query.order_by(Player.name.asc(), Player.id).limit(10)
+        index = next(index for index in Player.__table__.indexes
+                     if index.name == 'ix_players_name')
+
+        self.assertIn('ix_players_name', self.explain(query))
+
+        self.change_schema(index.drop)
+        try:
+            self.assertNotIn('ix_players_name', self.explain(query))
+        finally:
+            self.change_schema(index.create)
+
+
+class ImportCommandTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.runner = self.app.test_cli_runner()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        db.session.remove()
+        db_drop_and_create_all()
+
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        db.session.close()
+        self.app_context.pop()
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as import_file:
+            import_file.write(content)
+        return path
+
+    def import_teams_and_agents(self):
+        teams = self.write('teams.csv',
+                           'id,name,abbr,city,state,total_payroll\n'
+                           '1,Test Team,TTT,Test City,Test State,1 USD\n')
+        agents = self.write('agents.ndjson',
+                            '{"id": 1, "name": "Test Agent", '
+                            '"salary": "1 USD"}\n')
+
+        self.assertEqual(self.runner.invoke(
+            args=['import', 'teams', teams]).exit_code, 0)
+        self.assertEqual(self.runner.invoke(
+            args=['import', 'agents', agents]).exit_code, 0)
+
+    def test_import_players(self):
+        self.import_teams_and_agents()
+        players = self.write(
+            'players.csv', 'name,number,position,salary,team_id,agent_id\n' +
+            ''.join(f'Player {number},{number},Pitcher,1 USD,1,1\n'
+                    for number in range(25)))
+
+        result = self.runner.invoke(
+            args=['import', 'players', players, '--batch-size', '10'])
+
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('20 rows', result.output)
+        self.assertIn('imported 25 players', result.output)
+        self.assertIn('rows/s', result.output)
+        self.assertEqual(Team.query.count(), 1)
+        self.assertEqual(Agent.query.count(), 1)
+        self.assertEqual(Player.query.count(), 25)
+
+    def test_import_players_adds_payroll(self):
+        self.import_teams_and_agents()
+        players = self.write(
+            'players.csv', 'name,number,position,salary,team_id,agent_id\n' +
+            ''.join(f'Player {number},{number},Pitcher,"1,000 USD",1,1\n'
+                    for number in range(25)))
+
+        result = self.runner.invoke(
+            args=['import', 'players', players, '--batch-size', '10'])
+
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(Team.query.one().total_payroll_cents, 2500000)
+
+    def test_import_teams_rejects_payroll(self):
+        teams = self.write('teams.csv',
+                           'name,abbr,city,state,total_payroll_cents\n'
+                           'Test Team,TTT,Test City,Test State,100\n')
+
+        result = self.runner.invoke(args=['import', 'teams', teams])
+
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn('total_payroll_cents is computed from the players',
+                      result.output)
+        self.assertEqual(Team.query.count(), 0)
+
+    def test_import_players_invalid_foreign_key(self):
+        self.import_teams_and_agents()
+        players = self.write('players.ndjson', ''.join(
+            json.dumps({'name': 'Player', 'number': '1',
+                        'position': 'Pitcher', 'salary': '1 USD',
+                        'team_id': team_id, 'agent_id': 1}) + '\n'
+            for team_id in (1, 9000)))
+
+        result = self.runner.invoke(args=['import', 'players', players])
+
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn('record 2: team_id 9000 does not exist', result.output)
+        self.assertEqual(Player.query.count(), 0)
+
+    def test_import_players_missing_column(self):
+        players = self.write('players.csv', 'name,number\nPlayer,1\n')
+
+        result = self.runner.invoke(args=['import', 'players', players])
+
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn('missing required columns: team_id, agent_id',
+                      result.output)
+
+
+class PayrollCommandTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.runner = self.app.test_cli_runner()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        db.session.remove()
+        db_drop_and_create_all()
+
+        Agent(name='Test Agent', salary='Test Salary USD').insert()
+        for name in ('First Team', 'Second Team'):
+            Team(name=name, abbr='TTT', city='Test City',
+                 state='Test State').insert()
+        Player.insert_many([
+            {'name': 'Test Player', 'number': '1', 'position': 'Pitcher',
+             'salary': '1 million USD', 'team_id': 1, 'agent_id': 1},
+            {'name': 'Test Player', 'number': '2', 'position': 'Pitcher',
+             'salary': 'Test Salary USD', 'team_id': 1, 'agent_id': 1}])
+
+    def tearDown(self):
+        db.session.close()
+        self.app_context.pop()
+
+    def drift(self):
+        db.session.execute(db.text(
+            'UPDATE teams SET total_payroll_cents = 5 WHERE id = 2'))
+        db.session.commit()
+
+    def test_verify(self):
+        result = self.runner.invoke(args=['payroll', 'verify'])
+
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('matches', result.output)
+
+    def test_verify_reports_drift(self):
+        self.drift()
+
+        result = self.runner.invoke(args=['payroll', 'verify'])
+
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn('team 2 (Second Team): 0.05 USD maintained, 0 USD '
+                      'from its players', result.output)
+        self.assertEqual(
+            db.session.query(Team.total_payroll_cents).filter(
+                Team.id == 2).scalar(), 5)
+
+    def test_verify_fix(self):
+        self.drift()
+
+        result = self.runner.invoke(args=['payroll', 'verify', '--fix'])
+
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('fixed 1 teams', result.output)
+        self.assertEqual(dict(db.session.query(
+            Team.id, Team.total_payroll_cents)), {1: 100000000, 2: 0})
+
+    def test_verify_fix_refreshes_league_summary(self):
+        self.addCleanup(setattr, response_cache, 'backend',
+                        response_cache.backend)
+        response_cache.backend = MemoryBackend()
+        client = self.app.test_client()
+        headers = {'Authorization': f'Bearer {test_data.executive_jwt}'}
+        self.drift()
+
+        response = client.get('/league/summary', headers=headers)
+        self.assertEqual(response.get_json()['teams'][1]
+                         ['total_payroll_cents'], 5)
+
+        self.runner.invoke(args=['payroll', 'verify', '--fix'])
+
+        response = client.get('/league/summary', headers=headers)
+        self.assertEqual(response.get_json()['teams'][1]
+                         ['total_payroll_cents'], 0)
+        self.assertEqual(response.get_json()['total_payroll_cents'],
+                         100000000)
+
+
+class SharedCacheStandIn(object):
+    """The subset of the redis client SharedBackend uses, in a dict"""
+    def __init__(self):
+        self.values = {}
+        self.fail = False
+
+    def check(self):
+        if self.fail:
+            raise ConnectionError('cache unavailable')
+
+    def get(self, key):
+        self.check()
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        self.check()
+        self.values[key] = value
+
+    def mget(self, keys):
+        self.check()
+        return [self.values.get(key) for key in keys]
+
+    def incr(self, key):
+        self.check()
+        self.values[key] = int(self.values.get(key, 0)) + 1
+        return self.values[key]
+
+
+class ResponseCacheTestCase(unittest.TestCase):
+    def make_backend(self):
+        return MemoryBackend()
+
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.client = self.app.test_client
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        self.addCleanup(setattr, response_cache, 'backend',
+                        response_cache.backend)
+        response_cache.backend = self.make_backend()
+
+        db.session.remove()
+        db_drop_and_create_all()
+
+        Agent(name='Test Agent', salary='Test Salary USD').insert()
+        Agent(name='Other Agent', salary='Test Salary USD').insert()
+        for name in ('First Team', 'Second Team', 'Third Team'):
+            Team(name=name, abbr='TTT', city='Test City',
+                 state='Test State').insert()
+        for team_id in (1, 2, 3):
+            Player(name=f'Player {team_id}', number='00',
+                   position='Test Position', salary='Test Salary USD',
+                   team_id=team_id, agent_id=1).insert()
+        db.session.close()
+
+        self.headers = {'Authorization': f'Bearer {test_data.executive_jwt}'}
+
+    def tearDown(self):
+        db.session.close()
+        self.app_context.pop()
+
+    def get(self, path):
+        """GETs path, returning the response and whether it was served from
+        the cache (it ran no query besides the ETag's version lookup)"""
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute',
+                     before_cursor_execute)
+        try:
+            response = self.client().get(path, headers=self.headers)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute',
+                         before_cursor_execute)
+
+        return response, all('table_versions' in statement
+                             for statement in statements)
+
+    def test_get_cached(self):
+        for path in ('/players?sort=name', '/teams', '/teams/1/roster',
+                     '/agents/1/clients', '/players/1/details',
+                     '/league/summary'):
+            response, from_cache = self.get(path)
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(from_cache)
+
+            cached_response, from_cache = self.get(path)
+            self.assertEqual(cached_response.status_code, 200)
+            self.assertTrue(from_cache)
+            self.assertEqual(cached_response.get_json(), response.get_json())
+
+        # the query string is part of the key
+        self.assertFalse(self.get('/players?sort=-name')[1])
+
+    def test_player_write_invalidates_league_summary(self):
+        self.get('/league/summary')
+
+        response = self.client().patch(
+            '/players/1', json={'team_id': 2, 'salary': 1000},
+            headers={'Authorization': f'Bearer {test_data.agent_jwt}'})
+        self.assertEqual(response.status_code, 200)
+
+        response, from_cache = self.get('/league/summary')
+        self.assertFalse(from_cache)
+        self.assertEqual([team['total_players'] for team
+                          in response.get_json()['teams']], [0, 2, 1])
+        self.assertEqual(response.get_json()['total_payroll_cents'], 100000)
+
+    def test_patch_player_invalidates_affected_responses(self):
+        for path in ('/teams/1/roster', '/teams/2/roster', '/teams/3/roster',
+                     '/agents/1/clients', '/agents/2/clients'):
+            self.get(path)
+
+        response = self.client().patch(
+            '/players/1', json={'team_id': 2, 'agent_id': 2},
+            headers={'Authorization': f'Bearer {test_data.agent_jwt}'})
+        self.assertEqual(response.status_code, 200)
+
+        response, from_cache = self.get('/teams/1/roster')
+        self.assertFalse(from_cache)
+        self.assertEqual(response.status_code, 404)
+
+        response, from_cache = self.get('/teams/2/roster')
+        self.assertFalse(from_cache)
+        self.assertEqual(response.get_json()['total_team_players'], 2)
+
+        self.assertFalse(self.get('/agents/1/clients')[1])
+        self.assertFalse(self.get('/agents/2/clients')[1])
+
+        # teams and agents the player never belonged to keep their entries
+        self.assertTrue(self.get('/teams/3/roster')[1])
+
+    @contextmanager
+    def gate_roster_query(self):
+        """Holds every roster query until the gate is opened"""
+        gate = {'queries': 0, 'started': threading.Event(),
+                'open': threading.Event()}
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            if 'LEFT OUTER JOIN players' in statement:
+                gate['queries'] += 1
+                gate['started'].set()
+                gate['open'].wait(5)
+
+        event.listen(db.engine, 'before_cursor_execute',
+                     before_cursor_execute)
+        try:
+            yield gate
+        finally:
+            gate['open'].set()
+            event.remove(db.engine, 'before_cursor_execute',
+                         before_cursor_execute)
+
+    def get_in_thread(self, path, responses):
+        thread = threading.Thread(target=lambda: responses.append(
+            self.client().get(path, headers=self.headers)))
+        thread.start()
+        return thread
+
+    def test_concurrent_requests_share_one_computation(self):
+        self.addCleanup(setattr, response_cache, 'coalesced',
+                        response_cache.coalesced)
+        coalesced = response_cache.coalesced
+        responses = []
+
+        with self.gate_roster_query() as gate:
+            threads = [self.get_in_thread('/teams/1/roster', responses)]
+            gate['started'].wait(5)
+            threads += [self.get_in_thread('/teams/1/roster', responses)
+                        for _ in range(5)]
+            # let the followers reach the in flight computation
+            time.sleep(0.2)
+            gate['open'].set()
+            for thread in threads:
+                thread.join(5)
+
+        self.assertEqual(gate['queries'], 1)
+        self.assertEqual(len(responses), 6)
+        self.assertEqual({response.status_code for response in responses},
+                         {200})
+        self.assertEqual(len({response.data for response in responses}), 1)
+        self.assertEqual(response_cache.coalesced - coalesced, 5)
+
+    def test_stale_entry_served_while_refreshing(self):
+        self.addCleanup(setattr, response_cache, 'ttl', response_cache.ttl)
+        # entries are stale as soon as they're stored
+        response_cache.ttl = 0
+        self.get('/teams/1/roster')
+
+        # changed behind the cache's back, so the entry isn't invalidated
+        db.session.execute(db.text(
+            "UPDATE teams SET name = 'Renamed Team' WHERE id = 1"))
+        db.session.commit()
+        db.session.close()
+
+        responses = []
+        with self.gate_roster_query() as gate:
+            refresh = self.get_in_thread('/teams/1/roster', responses)
+            gate['started'].wait(5)
+
+            # served from the stale entry, without a second roster query
+            response = self.client().get('/teams/1/roster',
+                                         headers=self.headers)
+            self.assertEqual(response.get_json()['team'], 'First Team')
+
+            gate['open'].set()
+            refresh.join(5)
+
+        self.assertEqual(gate['queries'], 1)
+        self.assertEqual(responses[0].get_json()['team'], 'Renamed Team')
+
+    def test_entry_keeps_its_etag_until_invalidated(self):
+        # a write by another worker or process bumps the table version but
+        # can't invalidate this worker's cache
+        response, _ = self.get('/players')
+        self.assertEqual(response.get_json()['total_players'], 3)
+        etag = response.headers['ETag']
+
+        db.session.execute(db.text(
+            "INSERT INTO players (name, number, position, salary, team_id, "
+            "agent_id) VALUES ('Player 4', '00', 'Test Position', "
+            "'Test Salary USD', 1, 1)"))
+        bump_versions('players')
+        db.session.commit()
+
+        # the stale body goes out under the ETag it was cached with, not the
+        # new versions', so a client never gets a 304 for it later
+        response, from_cache = self.get('/players')
+        self.assertTrue(from_cache)
+        self.assertEqual(response.get_json()['total_players'], 3)
+        self.assertEqual(response.headers['ETag'], etag)
+
+        # as flask import and flask payroll verify --fix do
+        response_cache.invalidate('players')
+
+        response, from_cache = self.get('/players')
+        self.assertFalse(from_cache)
+        self.assertEqual(response.get_json()['total_players'], 4)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+        response, from_cache = self.get('/players')
+        self.assertTrue(from_cache)
+        self.assertEqual(response.get_json()['total_players'], 4)
+
+    def test_patch_team_invalidates_team_responses(self):
+        self.get('/teams/1/roster')
+        self.get('/teams/2/roster')
+
+        response = self.client().patch(
+            '/teams/1', json={'name': 'Renamed Team'},
+            headers={'Authorization': f'Bearer {test_data.agent_jwt}'})
+        self.assertEqual(response.status_code, 200)
+
+        response, from_cache = self.get('/teams/1/roster')
+        self.assertFalse(from_cache)
+        self.assertEqual(response.get_json()['team'], 'Renamed Team')
+        self.assertTrue(self.get('/teams/2/roster')[1])
+
+
+class SharedResponseCacheTestCase(ResponseCacheTestCase):
+    def make_backend(self):
+        self.stand_in = SharedCacheStandIn()
+        return SharedBackend(self.stand_in)
+
+    def test_unavailable_cache_falls_back_to_database(self):
+        self.get('/teams/1/roster')
+        self.stand_in.fail = True
+
+        response, from_cache = self.get('/teams/1/roster')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(from_cache)
+
+
+class SingleFlightTestCase(unittest.TestCase):
+    def test_concurrent_calls_share_result(self):
+        flights = SingleFlight()
+        release = threading.Event()
+        calls = []
+        results = []
+
+        def slow():
+            calls.append(1)
+            release.wait(5)
+            return 'result'
+
+        leader = threading.Thread(
+            target=lambda: results.append(flights.do('key', slow)))
+        leader.start()
+        while not calls:
+            time.sleep(0.01)
+
+        self.assertEqual(flights.do('key', slow, wait=False), (None, True))
+
+        follower = threading.Thread(
+            target=lambda: results.append(flights.do('key', slow)))
+        follower.start()
+        time.sleep(0.1)
+        release.set()
+        leader.join(5)
+        follower.join(5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(results), [('result', False),
+                                           ('result', True)])
+        # the next call runs again
+        self.assertEqual(flights.do('key', lambda: 'again'),
+                         ('again', False))
+
+    def test_failed_call_not_shared(self):
+        flights = SingleFlight()
+
+        def fail():
+            raise ValueError('failed')
+
+        with self.assertRaises(ValueError):
+            flights.do('key', fail)
+        self.assertEqual(flights.do('key', lambda: 'ok'), ('ok', False))
+
+
+class MemoryBackendTestCase(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        backend = MemoryBackend(maxsize=2)
+        backend.set('a', b'1', 60)
+        backend.set('b', b'2', 60)
+        backend.get('a')
+        backend.set('c', b'3', 60)
+
+        self.assertEqual(backend.get('a'), b'1')
+        self.assertIsNone(backend.get('b'))
+        self.assertEqual(backend.get('c'), b'3')
+
+    def test_expires_entries(self):
+        backend = MemoryBackend()
+        backend.set('a', b'1', 0)
+
+        self.assertIsNone(backend.get('a'))
+
+    def test_generations_survive_eviction(self):
+        backend = MemoryBackend(maxsize=1)
+        backend.incr('roster:1')
+        backend.set('a', b'1', 60)
+        backend.set('b', b'2', 60)
+
+        self.assertEqual(backend.generations(['roster:1', 'teams']), [1, 0])
+
+
+class MoneyTestCase(unittest.TestCase):
+    def test_parse_money(self):
+        self.assertEqual(parse_money('583,500 USD'), 58350000)
+        self.assertEqual(parse_money('1.1 million USD'), 110000000)
+        self.assertEqual(parse_money('$2.5M'), 250000000)
+        self.assertEqual(parse_money(1500000), 150000000)
+        self.assertEqual(parse_money(0.015), 2)
+
+    def test_parse_money_rejects(self):
+        for value in ('Test Salary USD', 'SO. MUCH. MONEY', '', -1, True,
+                      float('nan'), None):
+            with self.assertRaises(ValueError):
+                parse_money(value)
+
+    def test_format_money(self):
+        self.assertEqual(format_money(58350000), '583,500 USD')
+        self.assertEqual(format_money(110000000), '1.1 million USD')
+        self.assertEqual(format_money(100000000), '1 million USD')
+        self.assertEqual(format_money(1050), '10.50 USD')
+
+    def test_money_value_keeps_strings(self):
+        self.assertEqual(money_value('1 million USD'),
+                         ('1 million USD', 100000000))
+        self.assertEqual(money_value('Test Salary USD'),
+                         ('Test Salary USD', None))
+        self.assertEqual(money_value(250000), ('250,000 USD', 25000000))
+
+
+class IdCacheTestCase(unittest.TestCase):
+    def test_disabled_by_default_ttl(self):
+        cache = IdCache(ttl=0)
+        cache.add('teams', 1)
+
+        self.assertNotIn(('teams', 1), cache)
+
+    def test_add_and_discard(self):
+        cache = IdCache(ttl=60)
+        cache.add('teams', 1)
+
+        self.assertIn(('teams', 1), cache)
+        self.assertNotIn(('agents', 1), cache)
+
+        cache.discard('teams', 1)
+        self.assertNotIn(('teams', 1), cache)
+
+    def test_forgets_after_ttl(self):
+        cache = IdCache(ttl=60)
+        cache.add('teams', 1)
+        cache._reset_at -= 60
+
+        self.assertNotIn(('teams', 1), cache)
+
 
 if __name__ == '__main__':
     unittest.main()
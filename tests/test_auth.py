@@ -0,0 +1,401 @@
+import json
+import os
+import threading
+import time
+import unittest
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from Crypto.PublicKey import RSA
+from jose import jwk, jwt
+
+from werkzeug.exceptions import BadRequest, Forbidden
+
+from auth.auth import API_AUDIENCE, AuthError, ISSUER, check_permissions, \
+    jwks_store, rejected_tokens, verify_decode_jwt
+from auth.jwks import FileJWKSStore, JWKSStore, PublicKey, parse_jwks
+from auth.local_issuer import mint_token
+from auth.metrics import Histogram
+from auth.permissions import PermissionRegistry, TokenPayload
+from auth.throttle import FailureLimiter
+from auth.token_cache import TokenCache
+from . import SIGNING_KEY_PATH
+
+PRIVATE_PEM = RSA.generate(2048).export_key().decode('utf-8')
+PUBLIC_JWK = jwk.construct(PRIVATE_PEM, 'RS256').public_key().to_dict()
+
+
+class CountingJWKSStore(JWKSStore):
+    """serves a canned key set and counts how often it was fetched"""
+    def __init__(self, jwks, **kwargs):
+        super().__init__('http://jwks.invalid/', **kwargs)
+        self.jwks = jwks
+        self.fetch_count = 0
+
+    def fetch(self):
+        self.fetch_count += 1
+        return self.jwks
+
+
+def make_jwks(*kids):
+    return {'keys': [dict(PUBLIC_JWK, kid=kid, use='sig') for kid in kids]}
+
+
+def make_token(kid='key-1'):
+    return jwt.encode({'sub': 'user'}, PRIVATE_PEM, algorithm='RS256',
+                      headers={'kid': kid})
+
+
+class PublicKeyTestCase(unittest.TestCase):
+    def test_verify_valid_signature(self):
+        key = PublicKey(dict(PUBLIC_JWK, kid='key-1'))
+
+        self.assertTrue(key.verify(make_token()))
+
+    def test_verify_tampered_token(self):
+        key = PublicKey(dict(PUBLIC_JWK, kid='key-1'))
+        header, payload, signature = make_token().split('.')
+        tampered = '.'.join([header, payload + 'x', signature])
+
+        self.assertFalse(key.verify(tampered))
+        self.assertFalse(key.verify('not-a-token'))
+
+    def test_parse_jwks_skips_unusable_keys(self):
+        jwks = make_jwks('key-1')
+        jwks['keys'].append(dict(PUBLIC_JWK, kid='key-2', use='enc'))
+        jwks['keys'].append({'kid': 'key-3', 'kty': 'RSA', 'n': 'bad'})
+
+        self.assertEqual(list(parse_jwks(jwks)), ['key-1'])
+
+
+class JWKSStoreTestCase(unittest.TestCase):
+    def test_get_key_fetches_once_while_fresh(self):
+        store = CountingJWKSStore(make_jwks('key-1'))
+
+        for _ in range(100):
+            self.assertEqual(store.get_key('key-1').kid, 'key-1')
+
+        self.assertEqual(store.fetch_count, 1)
+
+    def test_get_key_serves_stale_key_while_refreshing_after_ttl(self):
+        store = CountingJWKSStore(make_jwks('key-1'), ttl=600)
+        store.get_key('key-1')
+
+        # pretend the key set was fetched longer than ttl ago
+        store.fetched_at -= 601
+        store.attempted_at -= 601
+        self.assertEqual(store.get_key('key-1').kid, 'key-1')
+        store.wait_for_refresh()
+
+        self.assertEqual(store.fetch_count, 2)
+        self.assertFalse(store.is_expired(time.monotonic()))
+
+    def test_get_key_refetches_on_unknown_kid(self):
+        store = CountingJWKSStore(make_jwks('key-1'), min_refresh_interval=30)
+        store.get_key('key-1')
+        store.attempted_at -= 31
+
+        # provider rotated its signing key
+        store.jwks = make_jwks('key-1', 'key-2')
+        store.get_key('key-2')
+        store.wait_for_refresh()
+
+        self.assertEqual(store.get_key('key-2').kid, 'key-2')
+        self.assertEqual(store.fetch_count, 2)
+
+    def test_get_key_unknown_kid_refetch_is_rate_limited(self):
+        store = CountingJWKSStore(make_jwks('key-1'), min_refresh_interval=30)
+        store.get_key('key-1')
+
+        for _ in range(10):
+            self.assertIsNone(store.get_key('made-up'))
+
+        self.assertEqual(store.fetch_count, 1)
+
+    def test_get_key_concurrent_cold_start_fetches_once(self):
+        store = CountingJWKSStore(make_jwks('key-1'))
+        threads = [threading.Thread(target=store.get_key, args=('key-1',))
+                   for _ in range(20)]
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(store.fetch_count, 1)
+
+
+class JWKSHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        time.sleep(self.server.delay)
+        body = json.dumps(self.server.jwks).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class JWKSServerTestCase(unittest.TestCase):
+    """runs the store against a local HTTP stand-in for the identity
+    provider's jwks.json"""
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), JWKSHandler)
+        self.server.jwks = make_jwks('key-1')
+        self.server.delay = 0
+        self.url = f'http://127.0.0.1:{self.server.server_port}/jwks.json'
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_get_key_fetches_from_server(self):
+        store = JWKSStore(self.url)
+
+        self.assertEqual(store.get_key('key-1').kid, 'key-1')
+
+    def test_get_key_slow_server_serves_stale_key(self):
+        store = JWKSStore(self.url, ttl=600, timeout=0.1)
+        store.get_key('key-1')
+        store.fetched_at -= 601
+        store.attempted_at -= 601
+        self.server.delay = 0.5
+
+        started = time.monotonic()
+        key = store.get_key('key-1')
+        elapsed = time.monotonic() - started
+        store.wait_for_refresh()
+
+        self.assertEqual(key.kid, 'key-1')
+        self.assertLess(elapsed, 0.1)
+        # the fetch timed out, the stale keys are still in place
+        self.assertIsNotNone(store.last_error)
+        self.assertEqual(store.get_key('key-1').kid, 'key-1')
+
+    def test_start_refresher_picks_up_rotated_keys(self):
+        store = JWKSStore(self.url, min_refresh_interval=0)
+        store.start_refresher(interval=0.05)
+        self.addCleanup(store.stop_refresher)
+
+        self.server.jwks = make_jwks('key-1', 'key-2')
+        deadline = time.monotonic() + 5
+        while 'key-2' not in store.keys and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        self.assertIn('key-2', store.keys)
+
+
+class LocalIssuerTestCase(unittest.TestCase):
+    def test_file_store_reads_local_jwks(self):
+        store = FileJWKSStore(os.environ['JWKS_PATH'])
+
+        self.assertEqual(list(store.keys), [])
+        self.assertEqual(store.get_key('local-signing-key').alg, 'RS256')
+
+    def test_verify_decode_jwt_accepts_minted_token(self):
+        token = mint_token(SIGNING_KEY_PATH, ['get:team-roster'],
+                           audience=API_AUDIENCE, issuer=ISSUER)
+
+        payload = verify_decode_jwt(token)
+
+        self.assertEqual(payload['permissions'], ['get:team-roster'])
+
+    def test_verify_decode_jwt_rejects_expired_minted_token(self):
+        token = mint_token(SIGNING_KEY_PATH, ['post:players'],
+                           audience=API_AUDIENCE, issuer=ISSUER,
+                           expires_in=-60)
+
+        with self.assertRaises(AuthError) as context:
+            verify_decode_jwt(token)
+
+        self.assertEqual(context.exception.error['code'], 'token_expired')
+
+    def test_verify_decode_jwt_rejects_wrong_audience(self):
+        token = mint_token(SIGNING_KEY_PATH, ['post:players'],
+                           audience='someone-else', issuer=ISSUER)
+
+        with self.assertRaises(AuthError) as context:
+            verify_decode_jwt(token)
+
+        self.assertEqual(context.exception.error['code'], 'invalid_claims')
+
+
+class RejectedTokenTestCase(unittest.TestCase):
+    def setUp(self):
+        self.token = mint_token(SIGNING_KEY_PATH, ['post:players'],
+                                audience=API_AUDIENCE, issuer=ISSUER,
+                                expires_in=-60)
+
+    def test_verify_decode_jwt_remembers_rejection(self):
+        for _ in range(2):
+            with self.assertRaises(AuthError) as context:
+                verify_decode_jwt(self.token)
+            self.assertEqual(context.exception.error['code'],
+                             'token_expired')
+
+        self.assertIsNotNone(rejected_tokens.get(self.token))
+
+    def test_verify_decode_jwt_rejection_malformed_token(self):
+        for _ in range(2):
+            with self.assertRaises(Exception):
+                verify_decode_jwt('not.a.token')
+
+        self.assertEqual(rejected_tokens.get('not.a.token')[1], 401)
+
+    def test_verify_decode_jwt_rechecks_after_key_set_changes(self):
+        with self.assertRaises(AuthError):
+            verify_decode_jwt(self.token)
+
+        jwks_store.generation += 1
+        self.addCleanup(setattr, jwks_store, 'generation',
+                        jwks_store.generation - 1)
+        with self.assertRaises(AuthError):
+            verify_decode_jwt(self.token)
+
+        self.assertEqual(rejected_tokens.get(self.token)[2],
+                         jwks_store.generation)
+
+
+class FailureLimiterTestCase(unittest.TestCase):
+    def test_is_throttled_after_limit(self):
+        limiter = FailureLimiter(limit=3, window=60)
+
+        for _ in range(2):
+            limiter.record('10.0.0.1')
+        self.assertFalse(limiter.is_throttled('10.0.0.1'))
+
+        limiter.record('10.0.0.1')
+        self.assertTrue(limiter.is_throttled('10.0.0.1'))
+        self.assertFalse(limiter.is_throttled('10.0.0.2'))
+
+    def test_window_resets_failures(self):
+        limiter = FailureLimiter(limit=1, window=60)
+        limiter.record('10.0.0.1')
+
+        started, failures = limiter._windows['10.0.0.1']
+        limiter._windows['10.0.0.1'] = (started - 61, failures)
+
+        self.assertFalse(limiter.is_throttled('10.0.0.1'))
+
+    def test_tracks_bounded_number_of_sources(self):
+        limiter = FailureLimiter(limit=1, window=60, max_sources=2)
+
+        for source in ('10.0.0.1', '10.0.0.2', '10.0.0.3'):
+            limiter.record(source)
+
+        self.assertFalse(limiter.is_throttled('10.0.0.1'))
+        self.assertTrue(limiter.is_throttled('10.0.0.3'))
+
+
+class PermissionRegistryTestCase(unittest.TestCase):
+    def test_register_assigns_one_bit_per_permission(self):
+        registry = PermissionRegistry()
+
+        teams = registry.register('get:teams')
+        roster = registry.register('get:team-roster')
+
+        self.assertEqual(registry.register('get:teams'), teams)
+        self.assertEqual(teams & roster, 0)
+        self.assertEqual(registry.register('get:teams', 'get:team-roster'),
+                         teams | roster)
+
+    def test_payload_mask_ignores_unregistered_permissions(self):
+        registry = PermissionRegistry()
+        teams = registry.register('get:teams')
+
+        payload = TokenPayload({'permissions': ['get:teams', 'unused']},
+                               registry)
+
+        self.assertEqual(registry.payload_mask(payload), teams)
+
+    def test_payload_mask_recomputed_after_new_registration(self):
+        registry = PermissionRegistry()
+        registry.register('get:teams')
+        payload = TokenPayload({'permissions': ['get:teams', 'get:agents']},
+                               registry)
+
+        agents = registry.register('get:agents')
+
+        self.assertEqual(registry.payload_mask(payload) & agents, agents)
+
+    def test_check_permissions(self):
+        payload = {'permissions': ['get:teams', 'get:team-roster']}
+
+        self.assertTrue(check_permissions('get:teams', payload))
+        self.assertTrue(check_permissions(['get:teams', 'get:team-roster'],
+                                          payload))
+        with self.assertRaises(Forbidden):
+            check_permissions('post:teams', payload)
+        with self.assertRaises(Forbidden):
+            check_permissions(['get:teams', 'post:teams'], payload)
+        with self.assertRaises(BadRequest):
+            check_permissions('get:teams', {})
+
+
+class HistogramTestCase(unittest.TestCase):
+    def test_render_cumulative_buckets(self):
+        histogram = Histogram('phase_seconds', 'Test.', 'phase',
+                              buckets=(0.001, 0.01))
+        histogram.observe('verify', 0.0005)
+        histogram.observe('verify', 0.005)
+        histogram.observe('verify', 1)
+
+        lines = histogram.render()
+
+        self.assertIn('phase_seconds_bucket{phase="verify",le="0.001"} 1',
+                      lines)
+        self.assertIn('phase_seconds_bucket{phase="verify",le="0.01"} 2',
+                      lines)
+        self.assertIn('phase_seconds_bucket{phase="verify",le="+Inf"} 3',
+                      lines)
+        self.assertIn('phase_seconds_count{phase="verify"} 3', lines)
+
+
+class TokenCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.payload = {'sub': 'user', 'exp': time.time() + 3600}
+
+    def test_get_counts_hits_and_misses(self):
+        cache = TokenCache()
+
+        self.assertIsNone(cache.get('token'))
+        cache.set('token', self.payload)
+        self.assertEqual(cache.get('token'), self.payload)
+        self.assertEqual(cache.get('token'), self.payload)
+
+        self.assertEqual(cache.stats()['hits'], 2)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_get_evicts_expired_token(self):
+        cache = TokenCache()
+        cache.set('token', {'sub': 'user', 'exp': time.time() - 1})
+
+        self.assertIsNone(cache.get('token'))
+        self.assertEqual(cache.stats()['size'], 0)
+
+    def test_set_skips_token_without_exp(self):
+        cache = TokenCache()
+        cache.set('token', {'sub': 'user'})
+
+        self.assertIsNone(cache.get('token'))
+
+    def test_set_evicts_least_recently_used(self):
+        cache = TokenCache(maxsize=2)
+        cache.set('token-1', self.payload)
+        cache.set('token-2', self.payload)
+        cache.get('token-1')
+        cache.set('token-3', self.payload)
+
+        self.assertIsNotNone(cache.get('token-1'))
+        self.assertIsNone(cache.get('token-2'))
+        self.assertIsNotNone(cache.get('token-3'))
+
+
+if __name__ == '__main__':
+    unittest.main()